@@ -0,0 +1,93 @@
+#cold against warm startup of the Post_2.py loading stages through the download cache
+#usage: python benchmarks/benchCache.py [--synthetic ROWS] [--runs N]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import geopandas as gpd
+from shapely.geometry import box
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from benchLoader import ENERGY_MSN, EXCLUDED_STATES, serve_directory, write_synthetic
+
+#writing a zipped shapefile of square toy states named like the synthetic SEDS states
+def write_toy_states(path, n_states = 50):
+    gdf = gpd.GeoDataFrame(
+        {'STUSPS': [f'S{i:02d}' for i in range(n_states)]},
+        geometry = [box(-125 + (i % 10) * 6, 25 + (i // 10) * 5, -120 + (i % 10) * 6, 29 + (i // 10) * 5)
+                    for i in range(n_states)],
+        crs = 'EPSG:4269'
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        gdf.to_file(os.path.join(tmp, 'tl_rd22_us_state.shp'))
+        with zipfile.ZipFile(path, 'w') as z:
+            for filename in os.listdir(tmp):
+                z.write(os.path.join(tmp, filename), filename)
+
+#the loading half of Post_2.py, timed from interpreter start so import cost is included
+def child(base_url, cache_dir):
+    start = time.perf_counter()
+
+    from pipelineTrace import peak_rss_kb
+    from sedsCache import DownloadCache, load_seds_cached, load_states_cached
+
+    cache = DownloadCache(cache_dir)
+    raw_continental_energy = load_seds_cached(
+        f'{base_url}/Complete_SEDS.csv', cache,
+        exclude_states = EXCLUDED_STATES, msn_codes = ENERGY_MSN
+    )
+    continental_energy = raw_continental_energy.pivot_table(
+        index = ['StateCode', 'Year'], columns = 'MSN', values = 'Data', observed = True
+    )
+    states = load_states_cached(f'{base_url}/tl_rd22_us_state.zip', cache)
+
+    print(f'{time.perf_counter() - start:.3f} {peak_rss_kb()} {len(continental_energy)} {len(states)}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', type = int, default = 2_000_000)
+    parser.add_argument('--runs', type = int, default = 3)
+    parser.add_argument('--child', nargs = 2, metavar = ('BASE_URL', 'CACHE_DIR'))
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, 'upstream')
+        os.makedirs(data_dir)
+        write_synthetic(os.path.join(data_dir, 'Complete_SEDS.csv'), args.synthetic)
+        write_toy_states(os.path.join(data_dir, 'tl_rd22_us_state.zip'))
+
+        server = serve_directory(data_dir)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+
+        def run(cache_dir):
+            result = subprocess.run(
+                [sys.executable, __file__, '--child', base_url, cache_dir],
+                capture_output = True, text = True, check = True
+            )
+            seconds, peak_kb = result.stdout.split()[:2]
+            return float(seconds), int(peak_kb)
+
+        cold, warm = [], []
+        for i in range(args.runs):
+            cache_dir = os.path.join(tmp, f'cache{i}')
+            cold.append(run(cache_dir))
+            warm.append(run(cache_dir))
+
+        server.shutdown()
+
+    for name, runs in (('cold', cold), ('warm', warm)):
+        print(f'{name} start: best {min(seconds for seconds, _ in runs):.3f}s of {args.runs}, '
+              f'peak {max(peak for _, peak in runs) / 1024:.0f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#worker processes each re-reading the Parquet copy and pivoting it against opening the memory-mapped cube store
+#usage: python benchmarks/benchCubeStore.py [--states N --years N --msns N --workers N]
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from benchPivot import synthetic_history
+from cubeStore import open_cube_store, write_cube_store
+from energyCube import SedsCube
+
+#high-water RSS of this process image; unlike ru_maxrss it is not carried over from the parent
+def peak_rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+#what every worker had to do before: read the long rows and pivot them into a cube of its own
+def parquet_worker(path, msns):
+    start = time.perf_counter()
+    df = pd.read_parquet(path, filters = [('MSN', 'in', msns)])
+    cube = SedsCube.from_long(df)
+    checksum = float(np.nansum(cube.values))
+    return time.perf_counter() - start, peak_rss_kb(), checksum
+
+def store_worker(path, msns):
+    start = time.perf_counter()
+    cube = open_cube_store(path, msns = msns)
+    checksum = float(np.nansum(cube.values))
+    return time.perf_counter() - start, peak_rss_kb(), checksum
+
+#a fresh spawned pool per mode so peak RSS is not inherited from this process or the other mode
+def run(worker, path, msns, workers):
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers = workers, mp_context = context) as ex:
+        results = list(ex.map(worker, [path] * workers, [msns] * workers))
+    timings, peaks, checksums = zip(*results)
+    return max(timings), max(peaks), checksums[0]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type = int, default = 52)
+    parser.add_argument('--years', type = int, default = 63)
+    parser.add_argument('--msns', type = int, default = 2000)
+    parser.add_argument('--workers', type = int, default = 4)
+    args = parser.parse_args()
+
+    raw_seds = synthetic_history(args.states, args.years, args.msns)
+    print(f'rows: {len(raw_seds)}')
+
+    #six MSN codes spread over the generated ones, like a metric evaluation would ask for
+    codes = list(raw_seds['MSN'].cat.categories)
+    selected = codes[::max(len(codes) // 6, 1)][:6]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        parquet_path = os.path.join(tmp, 'seds.parquet')
+        store_path = os.path.join(tmp, 'seds.cube')
+
+        raw_seds.to_parquet(parquet_path, index = False)
+        start = time.perf_counter()
+        write_cube_store(SedsCube.from_long(raw_seds, dtype = np.float32), store_path)
+        print(f'store written in {time.perf_counter() - start:.2f}s '
+              f'({os.path.getsize(os.path.join(store_path, "values.npy")) / 2**20:.1f}MB)')
+        del raw_seds
+
+        parquet_time, parquet_peak, parquet_sum = run(parquet_worker, parquet_path, selected, args.workers)
+        store_time, store_peak, store_sum = run(store_worker, store_path, selected, args.workers)
+
+        assert np.isclose(parquet_sum, store_sum, rtol = 1e-5)
+
+        print(f'parquet + pivot: {parquet_time * 1000:.1f}ms per worker, peak rss {parquet_peak / 1024:.1f}MB')
+        print(f'mapped store:    {store_time * 1000:.1f}ms per worker, peak rss {store_peak / 1024:.1f}MB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#sequential buffered downloads (requests.get + zipfile over BytesIO, as Post_1.py did) against the
+#concurrent streaming fetcher, served by a local stand-in that supports ranges, throttles each
+#connection and can drop connections part way through to exercise resuming
+#usage: python benchmarks/benchFetch.py [--files N --size MB --rate MB/s --workers N --drop-after MB]
+import argparse
+import functools
+import hashlib
+import http.server
+import io
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+import numpy as np
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from concurrentFetcher import ChecksumError, ConcurrentFetcher, FetchJob
+
+#static files with Range/If-Range support, a per-connection byte rate and an optional dropped
+#connection on the first request for each file
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, *args, directory = None, rate = None, drop_after = None, dropped = None, **kwargs):
+        self.root = directory
+        self.rate = rate
+        self.drop_after = drop_after
+        self.dropped = dropped
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = os.path.join(self.root, os.path.basename(self.path))
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+
+        size = os.path.getsize(path)
+        etag = f'"{int(os.path.getmtime(path))}-{size}"'
+        start = 0
+
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range', etag) == etag:
+            start = int(match.group(1))
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{size - 1}/{size}')
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('ETag', etag)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+
+        drop_at = None
+        if self.drop_after is not None and path not in self.dropped:
+            self.dropped.add(path)
+            drop_at = start + self.drop_after
+
+        block = 1 << 16
+        with open(path, 'rb') as f:
+            f.seek(start)
+            sent = start
+            while True:
+                data = f.read(block)
+                if not data:
+                    break
+                if drop_at is not None and sent + len(data) > drop_at:
+                    self.wfile.write(data[:drop_at - sent])
+                    self.close_connection = True
+                    self.connection.shutdown(2)
+                    return
+                self.wfile.write(data)
+                sent += len(data)
+                if self.rate:
+                    time.sleep(len(data) / self.rate)
+
+def serve_ranges(directory, rate = None, drop_after = None):
+    handler = functools.partial(RangeHandler, directory = directory, rate = rate,
+                                drop_after = drop_after, dropped = set())
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+#zips holding a compressible csv and an incompressible binary member, like a shapefile archive
+def write_toy_archives(directory, n_files, size):
+    rng = np.random.default_rng(0)
+    checksums = {}
+    for i in range(n_files):
+        path = os.path.join(directory, f'tl_2022_{i:02d}_county.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as z:
+            z.writestr(f'tl_2022_{i:02d}_county.dbf', ('GEOID,NAME\n' * (size // 22)).encode())
+            z.writestr(f'tl_2022_{i:02d}_county.shp', rng.bytes(size // 2))
+        with open(path, 'rb') as f:
+            checksums[os.path.basename(path)] = 'sha256:' + hashlib.sha256(f.read()).hexdigest()
+    return checksums
+
+#what Post_1.py did: one blocking request at a time, the whole body in memory, then unzip
+def legacy_fetch(urls, out_dir):
+    for url in urls:
+        response = requests.get(url, timeout = 60)
+        response.raise_for_status()
+        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
+            z.extractall(os.path.join(out_dir, os.path.basename(url)[:-4]))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--files', type = int, default = 8)
+    parser.add_argument('--size', type = float, default = 4, help = 'MB per archive')
+    parser.add_argument('--rate', type = float, default = 8, help = 'MB/s per connection, 0 for unthrottled')
+    parser.add_argument('--workers', type = int, default = 4)
+    parser.add_argument('--drop-after', type = float, default = 1, help = 'MB sent before the first connection drops')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upstream = os.path.join(tmp, 'upstream')
+        os.makedirs(upstream)
+        checksums = write_toy_archives(upstream, args.files, int(args.size * 2**20))
+        names = sorted(checksums)
+        rate = args.rate * 2**20 if args.rate else None
+
+        server = serve_ranges(upstream, rate = rate)
+        base = f'http://127.0.0.1:{server.server_port}'
+        urls = [f'{base}/{name}' for name in names]
+
+        out = os.path.join(tmp, 'legacy')
+        start = time.perf_counter()
+        legacy_fetch(urls, out)
+        legacy_time = time.perf_counter() - start
+
+        out = os.path.join(tmp, 'concurrent')
+        jobs = [FetchJob(url, os.path.join(out, name), checksums[name], os.path.join(out, name[:-4]))
+                for url, name in zip(urls, names)]
+        start = time.perf_counter()
+        with ConcurrentFetcher(max_workers = args.workers) as fetcher:
+            results = fetcher.fetch_all(jobs)
+        concurrent_time = time.perf_counter() - start
+        server.shutdown()
+
+        for name in names:
+            with zipfile.ZipFile(os.path.join(upstream, name)) as z:
+                for member in z.namelist():
+                    with open(os.path.join(out, name[:-4], member), 'rb') as f:
+                        assert f.read() == z.read(member), member
+
+        print(f'{args.files} archives of {args.size:g}MB at {args.rate:g}MB/s per connection')
+        print(f'sequential buffered: {legacy_time:.2f}s')
+        print(f'concurrent streamed: {concurrent_time:.2f}s ({legacy_time / concurrent_time:.1f}x), '
+              f'{sum(len(result.extracted) for result in results)} members extracted while streaming')
+
+        #every first connection drops part way through; the fetcher resumes with a range request
+        server = serve_ranges(upstream, rate = rate, drop_after = int(args.drop_after * 2**20))
+        base = f'http://127.0.0.1:{server.server_port}'
+        out = os.path.join(tmp, 'resumed')
+        jobs = [FetchJob(f'{base}/{name}', os.path.join(out, name), checksums[name], os.path.join(out, name[:-4]))
+                for name in names]
+        with ConcurrentFetcher(max_workers = args.workers) as fetcher:
+            results = fetcher.fetch_all(jobs)
+        print(f'dropped connections: {sum(result.resumed_from is not None for result in results)} of '
+              f'{len(results)} downloads resumed, all checksums verified')
+
+        #a wrong checksum is reported and the partial file removed
+        bad = FetchJob(f'{base}/{names[0]}', os.path.join(tmp, 'bad', names[0]), 'sha256:' + '0' * 64)
+        try:
+            ConcurrentFetcher().fetch(bad)
+        except ChecksumError as e:
+            print(f'checksum mismatch detected: {e}')
+        server.shutdown()
+        shutil.rmtree(os.path.join(tmp, 'bad'), ignore_errors = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+#write time and file size of the layer-per-year GeoPackage against the single-transaction writer
+#usage: python benchmarks/benchGeoPackage.py [--states N --years N --columns N --vertices N]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from geopackageWriter import write_yearly_geopackage
+
+#round toy states with enough vertices to stand in for TIGER boundaries
+def toy_states(n_states, vertices):
+    angles = np.linspace(0, 2 * np.pi, vertices, endpoint = False)
+    geometries = []
+    for i in range(n_states):
+        cx, cy = -125 + (i % 10) * 6, 26 + (i // 10) * 5
+        geometries.append(Polygon(np.column_stack([cx + 2.5 * np.cos(angles), cy + 2 * np.sin(angles)])))
+    return gpd.GeoDataFrame(
+        {'STUSPS': [f'S{i:02d}' for i in range(n_states)], 'NAME': [f'State {i}' for i in range(n_states)]},
+        geometry = geometries,
+        crs = 'EPSG:4269'
+    )
+
+def toy_yearly_dfs(states, n_years, n_columns):
+    rng = np.random.default_rng(0)
+    index = pd.Index(states, name = 'STUSPS')
+    columns = pd.Index([f'M{i:04d}' for i in range(n_columns)], name = 'MSN')
+    return {1960 + year: pd.DataFrame(rng.random((len(states), n_columns)), index = index, columns = columns)
+            for year in range(n_years)}
+
+#what Post_1.py and Post_2.py did before: join and write a full layer per year
+def legacy_write(gpk_path, states_gdf, yearly_dfs):
+    for year, pivot_df in yearly_dfs.items():
+        gdf = states_gdf.join(pivot_df, on = 'STUSPS', how = 'left')
+        gdf.to_file(gpk_path, layer = f'SEDS_States{year}', driver = 'GPKG')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type = int, default = 50)
+    parser.add_argument('--years', type = int, default = 60)
+    parser.add_argument('--columns', type = int, default = 9)
+    parser.add_argument('--vertices', type = int, default = 5000)
+    args = parser.parse_args()
+
+    states_gdf = toy_states(args.states, args.vertices)
+    yearly_dfs = toy_yearly_dfs(list(states_gdf['STUSPS']), args.years, args.columns)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, write in (('layer per year', legacy_write), ('single transaction', write_yearly_geopackage)):
+            gpk_path = os.path.join(tmp, name.replace(' ', '_') + '.gpkg')
+            start = time.perf_counter()
+            write(gpk_path, states_gdf, yearly_dfs)
+            elapsed = time.perf_counter() - start
+            print(f'{name:>18}: {elapsed:.2f}s, {os.path.getsize(gpk_path) / 2**20:.1f}MB')
+
+if __name__ == '__main__':
+    main()
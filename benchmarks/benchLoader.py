@@ -0,0 +1,113 @@
+#peak RSS of the old read-everything SEDS import against the streaming loader
+#usage: python benchmarks/benchLoader.py [path/to/Complete_SEDS.csv] [--http] [--synthetic ROWS]
+import argparse
+import functools
+import http.server
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import sedsLoader
+
+#the filters applied in Post_2.py right after loading
+EXCLUDED_STATES = ['HI', 'AK', 'X3', 'X5']
+ENERGY_MSN = ['CLEIB', 'DFEIB', 'NGEIB', 'SOEGP', 'NUETP', 'HYTCP', 'GEEGP', 'WYEGP', 'TPOPP']
+
+#loading the way Post_2.py did before: whole file as text, then StringIO, then filter
+def legacy_load(source):
+    from io import StringIO
+
+    if source.startswith('http'):
+        import requests
+        csv_content = requests.get(source).text
+    else:
+        with open(source) as f:
+            csv_content = f.read()
+
+    raw_seds = pd.read_csv(StringIO(csv_content))
+    return raw_seds[
+        (~raw_seds['StateCode'].isin(EXCLUDED_STATES)) &
+        (raw_seds['MSN'].isin(ENERGY_MSN))
+    ]
+
+def streamed_load(source):
+    return sedsLoader.load_seds(source, msn_codes = ENERGY_MSN, exclude_states = EXCLUDED_STATES)
+
+#writing a SEDS-shaped csv so the benchmark can run without the real file
+def write_synthetic(path, rows):
+    rng = np.random.default_rng(0)
+    states = [f'S{i:02d}' for i in range(50)] + EXCLUDED_STATES
+    msns = ENERGY_MSN + [f'M{i:04d}' for i in range(600)]
+    pd.DataFrame({
+        'Data_Status': '2022F',
+        'MSN': rng.choice(msns, rows),
+        'StateCode': rng.choice(states, rows),
+        'Year': rng.integers(1960, 2023, rows),
+        'Data': rng.random(rows) * 1e5,
+    }).to_csv(path, index = False)
+
+#serving the directory holding the csv over http as a local stand-in for eia.gov
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+def serve_directory(directory):
+    handler = functools.partial(QuietHandler, directory = directory)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+#each mode runs in a fresh interpreter so ru_maxrss only reflects that loader
+def run_child(mode, source):
+    result = subprocess.run(
+        [sys.executable, __file__, '--child', mode, source],
+        capture_output = True, text = True, check = True
+    )
+    return result.stdout.strip()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs = '?')
+    parser.add_argument('--http', action = 'store_true')
+    parser.add_argument('--synthetic', type = int, default = 2_000_000)
+    parser.add_argument('--child', nargs = 2, metavar = ('MODE', 'SOURCE'))
+    args = parser.parse_args()
+
+    if args.child:
+        mode, source = args.child
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        df = legacy_load(source) if mode == 'legacy' else streamed_load(source)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print(f'{mode}: rows={len(df)} peak_rss={peak / 1024:.1f}MB (import baseline {before / 1024:.1f}MB)')
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.path
+        if path is None:
+            path = os.path.join(tmp, 'Complete_SEDS.csv')
+            write_synthetic(path, args.synthetic)
+
+        source = os.path.abspath(path)
+        server = None
+        if args.http:
+            server = serve_directory(os.path.dirname(source))
+            source = f'http://127.0.0.1:{server.server_port}/{os.path.basename(source)}'
+
+        print(f'file size: {os.path.getsize(path) / 2**20:.1f}MB')
+        for mode in ('legacy', 'streamed'):
+            print(run_child(mode, source))
+
+        if server is not None:
+            server.shutdown()
+
+if __name__ == '__main__':
+    main()
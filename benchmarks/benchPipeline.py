@@ -0,0 +1,245 @@
+#time and memory of every pipeline stage on synthetic SEDS data, written as JSON for run-to-run tracking
+#usage: python benchmarks/benchPipeline.py [--scale small|state|county] [--states N --years N --msns N]
+#                                          [--stages load,pivot,...] [--output results.json]
+#                                          [--baseline old.json --threshold 1.25] [--trace trace.json]
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pipelineTrace
+from pipelineTrace import current_rss_kb, peak_rss_kb, reset_peak_rss
+from syntheticData import SCALES, synthetic_seds, toy_state_polygons, write_seds_csv
+
+STAGES = ['load', 'filter', 'pivot', 'metrics', 'join', 'geopackage', 'charts', 'maps']
+
+#the filters applied in Post_2.py right after loading
+EXCLUDED_STATES = ['HI', 'AK', 'X3', 'X5']
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+#one measured stage: the callable returns (result, rows_out, written paths)
+def measure(name, func, rows_in = None):
+
+    per_stage_peak = reset_peak_rss()
+    rss_before = current_rss_kb()
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    record = {'stage': name}
+    try:
+        result, rows_out, paths = func()
+    except Exception as e:
+        #a stage with a missing external renderer should not sink the rest of the run
+        message = next((line.strip() for line in str(e).splitlines() if line.strip()), '')
+        record['error'] = f'{type(e).__name__}: {message}'
+        result, rows_out, paths = None, None, []
+
+    record.update({
+        'wall_s': round(time.perf_counter() - wall, 4),
+        'cpu_s': round(time.process_time() - cpu, 4),
+        'peak_rss_mb': round(peak_rss_kb() / 1024, 1),
+        'rss_before_mb': round(rss_before / 1024, 1),
+        'peak_delta_mb': round((peak_rss_kb() - rss_before) / 1024, 1),
+        'peak_is_per_stage': per_stage_peak,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'bytes_written': sum(_size(path) for path in paths),
+    })
+    print(f"{name:>10}: {record['wall_s']:8.3f}s wall {record['cpu_s']:8.3f}s cpu "
+          f"{record['peak_rss_mb']:8.1f}MB peak" + (f"  ({record['error']})" if 'error' in record else ''))
+    return result, record
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = REPO_DIR,
+                              capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    import geopandas
+    import pandas
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'geopandas': geopandas.__version__,
+    }
+
+def run_pipeline(params, stages, work_dir):
+
+    from chartFactory import ChartJob, export_charts
+    from energyCube import SedsCube
+    from geopackageWriter import write_yearly_geopackage
+    from mapRenderer import render_map_series, yearly_series
+    from sedsFunctions import calculate_energy_metrics
+    from sedsLoader import load_seds
+
+    raw = synthetic_seds(params['states'], params['years'], params['msns'], density = params['density'])
+    csv_path = write_seds_csv(raw, os.path.join(work_dir, 'Complete_SEDS.csv'))
+    states_gdf = toy_state_polygons(list(raw['StateCode'].cat.categories), params['vertices'])
+    del raw
+
+    records = []
+
+    def stage(name, func, rows_in = None):
+        result, record = measure(name, func, rows_in)
+        records.append(record)
+        return result
+
+    #later stages need the earlier results, so they always run; only the selected ones are reported
+    def wanted(name):
+        return name in stages
+
+    def load():
+        df = load_seds(csv_path)
+        return df, len(df), []
+
+    raw_seds = stage('load', load) if wanted('load') else load()[0]
+
+    def filter_rows():
+        from energyMetrics import metric_inputs
+        mask = raw_seds['MSN'].isin(metric_inputs()) & ~raw_seds['StateCode'].isin(EXCLUDED_STATES)
+        df = raw_seds[mask.to_numpy()]
+        return df, len(df), []
+
+    filtered = stage('filter', filter_rows, len(raw_seds)) if wanted('filter') else filter_rows()[0]
+
+    def pivot():
+        yearly_dfs = SedsCube.from_long(raw_seds).yearly_frames()
+        return yearly_dfs, sum(len(df) for df in yearly_dfs.values()), []
+
+    yearly_dfs = stage('pivot', pivot, len(raw_seds)) if wanted('pivot') else pivot()[0]
+
+    def metrics():
+        df = calculate_energy_metrics(filtered)
+        return df, len(df), []
+
+    metrics_df = stage('metrics', metrics, len(filtered)) if wanted('metrics') else metrics()[0]
+
+    if wanted('join'):
+        def join():
+            gdf = states_gdf.merge(metrics_df.reset_index(), on = 'STUSPS')
+            return gdf, len(gdf), []
+        stage('join', join, len(metrics_df))
+
+    if wanted('geopackage'):
+        def geopackage():
+            gpk_path = os.path.join(work_dir, 'seds_states.gpkg')
+            write_yearly_geopackage(gpk_path, states_gdf, yearly_dfs, layer_prefix = 'SEDS_States')
+            return None, len(yearly_dfs) * len(states_gdf), [gpk_path]
+        stage('geopackage', geopackage, sum(len(df) for df in yearly_dfs.values()))
+
+    if wanted('charts'):
+        chart_states = list(metrics_df.index.get_level_values(0).unique()[:params['charts']])
+        years = sorted(metrics_df.index.get_level_values(1).unique())[-5:]
+
+        def charts():
+            jobs = [ChartJob(state, 'energy', years, os.path.join(work_dir, 'charts', f'{state}_energy.png'))
+                    for state in chart_states]
+            written = export_charts(jobs, metrics_df)
+            return None, len(written), written
+        stage('charts', charts, len(chart_states))
+
+    if wanted('maps'):
+        def maps():
+            values = yearly_series(yearly_dfs, 'NGEIB')
+            values = values.iloc[:, -params['map_years']:]
+            paths = render_map_series(states_gdf, values, os.path.join(work_dir, 'maps', 'ngeib_{year}.png'),
+                                      title = 'NGEIB for {year}', label = 'Natural Gas Energy Consumed')
+            return None, len(paths), paths
+        stage('maps', maps, len(states_gdf))
+
+    return records
+
+#stages slower than threshold x the baseline, matched by name
+def regressions(records, baseline, threshold):
+    previous = {record['stage']: record for record in baseline.get('stages', [])}
+    slower = []
+    for record in records:
+        old = previous.get(record['stage'])
+        if old and 'error' not in record and 'error' not in old and old['wall_s'] > 0:
+            ratio = record['wall_s'] / old['wall_s']
+            print(f"{record['stage']:>10}: {ratio:5.2f}x baseline")
+            if ratio > threshold:
+                slower.append(record['stage'])
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scale', choices = list(SCALES), default = 'small')
+    parser.add_argument('--states', type = int)
+    parser.add_argument('--years', type = int)
+    parser.add_argument('--msns', type = int)
+    parser.add_argument('--vertices', type = int)
+    parser.add_argument('--density', type = float, default = 0.9)
+    parser.add_argument('--charts', type = int, default = 4)
+    parser.add_argument('--map-years', type = int, default = 5)
+    parser.add_argument('--stages', default = ','.join(STAGES))
+    parser.add_argument('--output')
+    parser.add_argument('--trace', help = 'also write a Chrome trace of the instrumented functions')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type = float, default = 1.25)
+    args = parser.parse_args()
+
+    params = dict(SCALES[args.scale])
+    for name in ('states', 'years', 'msns', 'vertices'):
+        if getattr(args, name) is not None:
+            params[name] = getattr(args, name)
+    params.update({'scale': args.scale, 'density': args.density,
+                   'charts': args.charts, 'map_years': args.map_years})
+
+    stages = [name for name in args.stages.split(',') if name]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f'unknown stages {sorted(unknown)}, expected some of {STAGES}')
+
+    if args.trace:
+        pipelineTrace.enable(trace_path = args.trace)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        records = run_pipeline(params, stages, work_dir)
+
+    pipelineTrace.disable()
+
+    results = {
+        'benchmark': 'pipeline',
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'environment': environment(),
+        'parameters': params,
+        'stages': records,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent = 2)
+        print(f'results written to {args.output}')
+    else:
+        print(json.dumps(results, indent = 2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(records, json.load(f), args.threshold)
+        if slower:
+            print(f'regressions over {args.threshold}x: {slower}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
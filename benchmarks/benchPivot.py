@@ -0,0 +1,77 @@
+#per-year pivot loop from Post_1.py against the single-pass cube pivot
+#usage: python benchmarks/benchPivot.py [path/to/Complete_SEDS.csv] [--states N --years N --msns N]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from energyCube import yearly_pivots
+from sedsLoader import load_seds
+
+#the loop both scripts used: a full boolean scan and a pivot for every year
+def legacy_yearly_pivots(raw_seds):
+    yearly_dfs = {}
+    for year in raw_seds['Year'].unique():
+        seds_year = raw_seds[raw_seds['Year'] == year]
+        pivot_seds_year = seds_year.pivot(index = 'StateCode', columns = 'MSN', values = 'Data')
+        pivot_seds_year.index.name = 'STUSPS'
+        yearly_dfs[year] = pivot_seds_year
+    return yearly_dfs
+
+#long rows covering every (state, MSN, year) once, in the order of the SEDS csv
+def synthetic_history(n_states, n_years, n_msns):
+    rng = np.random.default_rng(0)
+    states = pd.Categorical([f'S{i:02d}' for i in range(n_states)])
+    msns = pd.Categorical([f'M{i:04d}' for i in range(n_msns)])
+    msn_idx, state_idx, year_idx = np.meshgrid(
+        np.arange(n_msns), np.arange(n_states), np.arange(n_years), indexing = 'ij'
+    )
+    return pd.DataFrame({
+        'StateCode': states[state_idx.ravel()],
+        'MSN': msns[msn_idx.ravel()],
+        'Year': (1960 + year_idx.ravel()).astype('int16'),
+        'Data': rng.random(msn_idx.size).astype('float32'),
+    })
+
+def best_of(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('path', nargs = '?')
+    parser.add_argument('--states', type = int, default = 52)
+    parser.add_argument('--years', type = int, default = 63)
+    parser.add_argument('--msns', type = int, default = 600)
+    parser.add_argument('--runs', type = int, default = 3)
+    args = parser.parse_args()
+
+    if args.path:
+        raw_seds = load_seds(args.path)
+    else:
+        raw_seds = synthetic_history(args.states, args.years, args.msns)
+    print(f'rows: {len(raw_seds)}')
+
+    legacy_time, legacy = best_of(lambda: legacy_yearly_pivots(raw_seds), args.runs)
+    cube_time, cube = best_of(lambda: yearly_pivots(raw_seds), args.runs)
+
+    #the cube keeps every state in every year, so compare on the rows the loop produced
+    for year, expected in legacy.items():
+        actual = cube[int(year)].loc[expected.index.astype(str), expected.columns.astype(str)]
+        np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), equal_nan = True)
+
+    print(f'per-year loop: {legacy_time:.3f}s')
+    print(f'single pivot:  {cube_time:.3f}s ({legacy_time / cube_time:.1f}x)')
+
+if __name__ == '__main__':
+    main()
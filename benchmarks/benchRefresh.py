@@ -0,0 +1,79 @@
+#the yearly refresh against rebuilding everything: metrics, one csv per state and the yearly GeoPackage
+#written from scratch, then incremental refreshes with nothing changed, a revised state and a new year
+#usage: python benchmarks/benchRefresh.py [--states N --years N --msns N --vertices N]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from syntheticData import synthetic_seds, toy_state_polygons
+from energyCube import SedsCube
+from energyMetrics import cube_metrics
+from geopackageWriter import write_yearly_geopackage
+from incrementalRefresh import geopackage_year_writer, incremental_refresh
+from sedsFunctions import export_state_energy_data
+
+#what a refresh cost before: every metric, csv and layer produced again
+def full_rebuild(cube, output_dir, gpk_path, states_gdf):
+    metrics_df = cube_metrics(cube)
+    export_state_energy_data(list(cube.states), metrics_df, output_dir)
+    write_yearly_geopackage(gpk_path, states_gdf, cube.yearly_frames())
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type = int, default = 49)
+    parser.add_argument('--years', type = int, default = 63)
+    parser.add_argument('--msns', type = int, default = 40)
+    parser.add_argument('--vertices', type = int, default = 2000)
+    args = parser.parse_args()
+
+    #the last year stands in for a new SEDS release
+    full = SedsCube.from_long(synthetic_seds(args.states, args.years + 1, args.msns))
+    history = SedsCube(full.values[:, :-1], full.states, full.years[:-1], full.msns)
+    states_gdf = toy_state_polygons(list(full.states), vertices = args.vertices)
+
+    #EIA revising one state's last five years
+    revised = SedsCube(full.values.copy(), full.states, full.years, full.msns)
+    revised.values[0, -5:] *= 1.01
+
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, 'w') as quiet:
+        stdout, sys.stdout = sys.stdout, quiet
+        try:
+            rebuild_dir = os.path.join(tmp, 'rebuild')
+            _, rebuild_time = timed(full_rebuild, full, rebuild_dir, os.path.join(rebuild_dir, 'states.gpkg'), states_gdf)
+
+            out = os.path.join(tmp, 'incremental')
+            gpk_path = os.path.join(out, 'states.gpkg')
+            runs = []
+            for label, cube in (('first run', history), ('nothing changed', history),
+                                ('new year', full), ('one state revised', revised)):
+                writer = geopackage_year_writer(gpk_path, cube, states_gdf)
+                result, seconds = timed(incremental_refresh, cube, out, write_year_layers = writer)
+                runs.append((label, seconds, result))
+        finally:
+            sys.stdout = stdout
+
+        #the refreshed metrics hold the same values as computing the revised input from scratch
+        expected = cube_metrics(revised)
+        refreshed = runs[-1][2]['metrics'].reindex(expected.index)
+        assert np.allclose(refreshed.to_numpy(), expected.to_numpy(), equal_nan = True)
+
+    print(f'{args.states} states x {args.years} years x {args.msns} MSNs')
+    print(f'full rebuild: {rebuild_time:.2f}s')
+    for label, seconds, result in runs:
+        print(f'{label:>18}: {seconds:.2f}s ({rebuild_time / seconds:.0f}x), {len(result["recomputed"])} slices '
+              f'recomputed, {len(result["csv"])} csvs, {len(result["layers"])} layers rewritten')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+#vector tile export of toy state polygons with synthetic SEDS years: tiling sequentially against
+#one process per zoom level, the cost of adding a year to an existing tileset, and a check of the
+#tiles and attributes served by the local tile server
+#usage: python benchmarks/benchTiles.py [--states N --years N --msns N --vertices N --max-zoom Z --workers N]
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from syntheticData import synthetic_seds, toy_state_polygons
+from energyCube import SedsCube
+from vectorTiles import add_tile_year, decode_tile, serve_tiles, write_vector_tiles
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--states', type = int, default = 49)
+    parser.add_argument('--years', type = int, default = 30)
+    parser.add_argument('--msns', type = int, default = 40)
+    parser.add_argument('--vertices', type = int, default = 2000, help = 'vertices per toy state outline')
+    parser.add_argument('--max-zoom', type = int, default = 7)
+    parser.add_argument('--workers', type = int, default = os.cpu_count())
+    args = parser.parse_args()
+
+    seds = synthetic_seds(args.states, args.years, args.msns)
+    yearly_dfs = SedsCube.from_long(seds).yearly_frames()
+    states_gdf = toy_state_polygons(sorted(seds['StateCode'].unique()), vertices = args.vertices)
+    last_year = max(yearly_dfs)
+    history = {year: df for year, df in yearly_dfs.items() if year != last_year}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = {}
+        for label, workers in (('sequential', None), (f'{args.workers} workers', args.workers)):
+            path = os.path.join(tmp, f'{label.split()[0]}.mbtiles')
+            start = time.perf_counter()
+            write_vector_tiles(path, states_gdf, history, max_zoom = args.max_zoom, workers = workers)
+            timings[label] = time.perf_counter() - start
+
+        #appending the newest year only writes its attributes
+        start = time.perf_counter()
+        add_tile_year(path, last_year, states_gdf, yearly_dfs[last_year])
+        add_time = time.perf_counter() - start
+
+        connection = sqlite3.connect(path)
+        n_tiles, tile_bytes = connection.execute('SELECT COUNT(*), SUM(LENGTH(tile_data)) FROM tiles').fetchone()
+        attribute_bytes = connection.execute('SELECT SUM(LENGTH(data)) FROM yearly_attributes').fetchone()[0]
+        connection.close()
+
+        print(f'{args.states} states x {args.years} years x {args.msns} MSNs, zoom 0-{args.max_zoom}, '
+              f'{args.vertices} vertices per state')
+        for label, seconds in timings.items():
+            print(f'{label}: {seconds:.2f}s')
+        print(f'{n_tiles} tiles ({tile_bytes / 2**20:.1f}MB gzipped geometry), '
+              f'{attribute_bytes / 2**20:.1f}MB attributes for {len(yearly_dfs)} years')
+        print(f'adding {last_year}: {add_time * 1000:.0f}ms')
+
+        server = serve_tiles(path)
+        base = f'http://127.0.0.1:{server.server_port}'
+        metadata = requests.get(f'{base}/metadata.json', timeout = 10).json()
+        assert json.loads(metadata['years'])[-1] == last_year
+
+        #every state outline appears in the world tile, and the baked year tile carries its values
+        shared = decode_tile(requests.get(f'{base}/0/0/0.pbf', timeout = 10).content)
+        baked = decode_tile(requests.get(f'{base}/{last_year}/0/0/0.pbf', timeout = 10).content)
+        assert {feature['properties']['STUSPS'] for feature in shared['states']} == set(states_gdf['STUSPS'])
+
+        expected = yearly_dfs[last_year]
+        for feature in baked['states']:
+            state = feature['properties']['STUSPS']
+            for column, value in feature['properties'].items():
+                if column not in ('STUSPS', 'NAME'):
+                    assert abs(value - expected.loc[state, column]) <= 1e-9 * max(1, abs(value)), (state, column)
+
+        attributes = requests.get(f'{base}/attributes/{last_year}.json', timeout = 10).json()
+        assert requests.get(f'{base}/{args.max_zoom + 1}/0/0.pbf', timeout = 10).status_code == 204
+        server.shutdown()
+
+        print(f'served: {len(shared["states"])} features in 0/0/0, {len(attributes)} states with '
+              f'{last_year} attributes, baked tile values match the cube')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#SEDS-shaped long rows and matching toy state polygons at a configurable scale, so the pipeline can be
+#measured without the live EIA and Census downloads
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from energyMetrics import metric_inputs
+
+#real postal codes first so regions and chart jobs work on small runs; county-sized runs add generic codes
+STATE_CODES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN',
+               'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH',
+               'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT',
+               'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+
+#named scales: states, years, MSN codes and polygon vertices
+SCALES = {
+    'small': {'states': 20, 'years': 20, 'msns': 50, 'vertices': 200},
+    'state': {'states': 51, 'years': 63, 'msns': 600, 'vertices': 2000},
+    'county': {'states': 3143, 'years': 63, 'msns': 100, 'vertices': 200},
+}
+
+def state_codes(n_states):
+    return STATE_CODES[:n_states] + [f'C{i:04d}' for i in range(max(0, n_states - len(STATE_CODES)))]
+
+#the MSN codes the metrics read, padded with filler codes up to n_msns
+def msn_codes(n_msns):
+    inputs = metric_inputs()
+    return inputs + [f'M{i:04d}' for i in range(max(0, n_msns - len(inputs)))]
+
+#long rows (StateCode, MSN, Year, Data) in the csv's MSN, state, year order; density < 1 drops
+#random rows the way SEDS has gaps for series a state does not report
+def synthetic_seds(n_states, n_years, n_msns, density = 1.0, first_year = 1960, seed = 0):
+
+    rng = np.random.default_rng(seed)
+    states = pd.Categorical(state_codes(n_states))
+    msns = pd.Categorical(msn_codes(n_msns))
+
+    msn_idx, state_idx, year_idx = np.meshgrid(
+        np.arange(len(msns)), np.arange(len(states)), np.arange(n_years), indexing = 'ij'
+    )
+    keep = slice(None) if density >= 1 else rng.random(msn_idx.size) < density
+
+    return pd.DataFrame({
+        'StateCode': states[state_idx.ravel()[keep]],
+        'MSN': msns[msn_idx.ravel()[keep]],
+        'Year': (first_year + year_idx.ravel()[keep]).astype('int16'),
+        'Data': (rng.random(msn_idx.size)[keep] * 1e5).astype('float32'),
+    })
+
+#writing the rows with the columns and order of Complete_SEDS.csv
+def write_seds_csv(df, path):
+    out = df[['MSN', 'StateCode', 'Year', 'Data']].copy()
+    out.insert(0, 'Data_Status', '2022F')
+    out.to_csv(path, index = False)
+    return path
+
+#a grid of square states whose edges are densified to the given vertex count; neighbours share
+#identical edge vertices, so the polygons form a clean coverage like the TIGER boundaries
+def toy_state_polygons(codes, vertices = 200, crs = 'EPSG:4269'):
+
+    columns = int(np.ceil(np.sqrt(len(codes) * 2)))
+    size = min(4.0, 60.0 / columns)
+    spacing = size * 4 / max(vertices, 4)
+
+    squares = [box(-125 + (i % columns) * size, 25 + (i // columns) * size,
+                   -125 + (i % columns + 1) * size, 25 + (i // columns + 1) * size)
+               for i in range(len(codes))]
+
+    return gpd.GeoDataFrame(
+        {'STUSPS': list(codes), 'NAME': [f'State {code}' for code in codes]},
+        geometry = shapely.segmentize(np.asarray(squares, dtype = object), spacing),
+        crs = crs
+    )
@@ -0,0 +1,183 @@
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+
+from energyQuery import EnergyQuery
+from pipelineTrace import traced
+
+#stacked bar chart definitions: metric group -> columns, title and axis labels
+METRIC_GROUPS = {
+    'energy': {
+        'columns': ['coal_GWh_total', 'diesel_GWh_total', 'natgas_GWh_total',
+                    'solar_GWh_total', 'nuclear_GWh_total', 'hydro_GWh_total',
+                    'geo_GWh_total', 'wind_GWh_total'],
+        'title': 'Energy Sources in {state} for Selected Years',
+        'labels': {'value': 'Energy Produced (GWh)', 'variable': 'Energy Source'},
+    },
+    'energy_percap': {
+        'columns': ['coal_GWh_percap', 'diesel_GWh_percap', 'natgas_GWh_percap',
+                    'solar_GWh_percap', 'nuclear_GWh_percap', 'hydro_GWh_percap',
+                    'geo_GWh_percap', 'wind_GWh_percap'],
+        'title': 'Energy Sources Per Capita in {state} for Selected Years',
+        'labels': {'value': 'Energy Produced (GWh) per capita', 'variable': 'Energy Source'},
+    },
+    'emissions': {
+        'columns': ['coal_emiss', 'diesel_emiss', 'natgas_emiss'],
+        'title': 'CO2 Emissions in {state} for Selected Years',
+        'labels': {'value': 'CO2 Equivalent Emissions', 'variable': 'Energy Source'},
+    },
+    'emissions_percap': {
+        'columns': ['coal_emiss_percap', 'diesel_emiss_percap', 'natgas_emiss_percap'],
+        'title': 'CO2 Emissions Per Capita in {state} for Selected Years',
+        'labels': {'value': 'CO2 Equivalant Emissions per capita', 'variable': 'Energy Source'},
+    },
+}
+
+#one chart to export: a state, a metric group from METRIC_GROUPS, the years and the output file
+ChartJob = namedtuple('ChartJob', ['state', 'group', 'years', 'filename'])
+
+#selecting the rows every job needs with one lookup on the (STUSPS, Year) index or a prebuilt EnergyQuery
+def select_chart_rows(df, jobs):
+
+    columns = sorted({column for job in jobs for column in METRIC_GROUPS[job.group]['columns']})
+
+    if isinstance(df, EnergyQuery):
+        state_years = {}
+        for job in jobs:
+            state_years.setdefault(job.state, set()).update(job.years)
+        return df.select_pairs(state_years, columns)
+
+    pairs = pd.MultiIndex.from_tuples(
+        sorted({(job.state, year) for job in jobs for year in job.years}),
+        names = df.index.names
+    )
+
+    #looking the pairs up through the sorted index (what reindex does), skipping pairs with no row,
+    #instead of testing every row of the table for membership
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index()
+    positions = df.index.get_indexer(pairs)
+    return df.iloc[positions[positions >= 0]][columns]
+
+def _stacked_bar(rows, state, group):
+    spec = METRIC_GROUPS[group]
+    return px.bar(
+        rows,
+        x = 'Year',
+        y = spec['columns'],
+        title = spec['title'].format(state = state),
+        labels = spec['labels'],
+        color_discrete_sequence = px.colors.qualitative.Pastel
+        )
+
+#building the figures for the jobs that have data; jobs without data are reported and skipped
+def build_chart_figures(jobs, df):
+
+    selected = select_chart_rows(df, jobs)
+    by_state = {state: rows.droplevel(0) for state, rows in selected.groupby(level = 0, sort = False)}
+
+    figures = []
+    for job in jobs:
+        rows = by_state.get(job.state)
+        rows = None if rows is None else rows[rows.index.isin(job.years)]
+
+        if rows is None or rows.empty:
+            print(f"No data found for {job.state} in the selected years: {job.years}")
+            continue
+
+        figures.append((job, _stacked_bar(rows.reset_index(), job.state, job.group)))
+
+    return figures
+
+#writing a batch of figures through one renderer session instead of a round-trip per chart
+@traced('write_images', output = lambda written, arguments: written)
+def write_figures(figures, filenames):
+
+    if not figures:
+        return []
+
+    if hasattr(pio, 'write_images'):
+        pio.write_images(list(figures), list(filenames))
+    else:
+        for fig, filename in zip(figures, filenames):
+            fig.write_image(filename)
+
+    return list(filenames)
+
+#building one batch of jobs' figures from the shared rows and writing them out, returning the file names
+def _export_batch(jobs, df):
+    figures = build_chart_figures(jobs, df)
+    return write_figures([fig for _, fig in figures], [job.filename for job, _ in figures])
+
+#exporting every job's stacked bar chart, optionally split across worker processes
+@traced('charts', output = lambda written, arguments: written)
+def export_charts(jobs, df, workers = None):
+
+    jobs = [ChartJob(*job) for job in jobs]
+    unknown = {job.group for job in jobs} - set(METRIC_GROUPS)
+    if unknown:
+        raise ValueError(f'Unknown metric groups {sorted(unknown)}, expected one of {list(METRIC_GROUPS)}')
+
+    for directory in {os.path.dirname(job.filename) for job in jobs}:
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+    #workers only receive the rows their jobs read
+    df = select_chart_rows(df, jobs)
+
+    if workers is None or workers <= 1:
+        written = _export_batch(jobs, df)
+    else:
+        batches = [batch for batch in (jobs[i::workers] for i in range(workers)) if batch]
+        with ProcessPoolExecutor(max_workers = workers) as ex:
+            written = [filename for batch in ex.map(_export_batch, batches, [df] * len(batches))
+                       for filename in batch]
+
+    for filename in written:
+        print(f'Chart Exported as {filename}')
+
+    return written
+
+#one figure with a facet per state for a metric group
+def faceted_chart(df, states, group, years, filename = None, facet_col_wrap = 4):
+
+    jobs = [ChartJob(state, group, years, None) for state in states]
+    spec = METRIC_GROUPS[group]
+
+    rows = select_chart_rows(df, jobs).reset_index()
+    fig = px.bar(
+        rows,
+        x = 'Year',
+        y = spec['columns'],
+        facet_col = rows.columns[0],
+        facet_col_wrap = facet_col_wrap,
+        title = spec['title'].format(state = ', '.join(states)),
+        labels = spec['labels'],
+        color_discrete_sequence = px.colors.qualitative.Pastel
+        )
+
+    if filename is not None:
+        write_figures([fig], [filename])
+        print(f'Chart Exported as {filename}')
+
+    return fig
+
+#all charts in one HTML page that loads plotly.js once; needs no image renderer at all
+def export_html_bundle(jobs, df, filename, include_plotlyjs = 'cdn'):
+
+    figures = build_chart_figures([ChartJob(*job) for job in jobs], df)
+
+    parts = [fig.to_html(full_html = False, include_plotlyjs = include_plotlyjs if i == 0 else False)
+             for i, (_, fig) in enumerate(figures)]
+
+    with open(filename, 'w', encoding = 'utf-8') as f:
+        f.write('<html><head><meta charset="utf-8"></head><body>\n')
+        f.write('\n'.join(parts))
+        f.write('\n</body></html>\n')
+
+    print(f'Chart Exported as {filename}')
+    return filename
@@ -0,0 +1,433 @@
+import hashlib
+import json
+import os
+import struct
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+#census TIGER/Line files by vintage and layer, e.g. tiger_url('county', 2022)
+TIGER_URL = 'https://www2.census.gov/geo/tiger/TIGER{year}/{LAYER}/tl_{year}_us_{layer}.zip'
+
+def tiger_url(layer, year = 2022):
+    return TIGER_URL.format(year = year, LAYER = layer.upper(), layer = layer.lower())
+
+#one download: where it goes, an optional 'algorithm:hexdigest' checksum and an optional directory
+#to unzip into while it streams
+FetchJob = namedtuple('FetchJob', ['url', 'path', 'checksum', 'extract_to'], defaults = [None, None])
+
+#etag and last_modified are the validators the server sent, for callers that revalidate later
+FetchResult = namedtuple('FetchResult', ['url', 'path', 'bytes', 'resumed_from', 'checksum', 'extracted',
+                                         'etag', 'last_modified'], defaults = [None, None])
+
+#the downloaded bytes do not match the expected checksum
+class ChecksumError(ValueError):
+    pass
+
+_LOCAL_HEADER = b'PK\x03\x04'
+_DESCRIPTOR = b'PK\x07\x08'
+_END_SIGNATURES = (b'PK\x01\x02', b'PK\x05\x06', b'PK\x06\x06')
+
+#extracting a zip archive from its local file headers as the bytes arrive, so members are on disk
+#when the download finishes; archives it cannot stream (encryption, stored members with trailing
+#sizes, other compression methods) are flagged and extracted from the finished file instead
+class StreamingUnzipper:
+
+    def __init__(self, extract_to):
+        self.extract_to = extract_to
+        self.extracted = []
+        self.unsupported = False
+        self.done = False
+        self._buffer = bytearray()
+        self._member = None
+
+    def feed(self, data):
+        if self.done or self.unsupported:
+            return
+        self._buffer += data
+        while self._step():
+            pass
+
+    def _target(self, name):
+        path = os.path.normpath(os.path.join(self.extract_to, name))
+        if not path.startswith(os.path.normpath(self.extract_to) + os.sep):
+            raise ValueError(f'Zip member {name!r} would be extracted outside {self.extract_to}')
+        return path
+
+    #one unit of work; returns False when more bytes are needed
+    def _step(self):
+        if self._member is None:
+            return self._start_member()
+        return self._continue_member()
+
+    def _start_member(self):
+
+        if len(self._buffer) < 4:
+            return False
+        signature = bytes(self._buffer[:4])
+        if signature in _END_SIGNATURES:
+            self.done = True
+            return False
+        if signature != _LOCAL_HEADER:
+            self.unsupported = True
+            return False
+        if len(self._buffer) < 30:
+            return False
+
+        _, _, flags, method, _, _, crc, compressed, size, name_length, extra_length = struct.unpack(
+            '<4sHHHHHIIIHH', self._buffer[:30]
+        )
+        header_length = 30 + name_length + extra_length
+        if len(self._buffer) < header_length:
+            return False
+
+        name = bytes(self._buffer[30:30 + name_length]).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = bytes(self._buffer[30 + name_length:header_length])
+        zip64 = False
+        if compressed == 0xFFFFFFFF or size == 0xFFFFFFFF:
+            size, compressed, zip64 = self._zip64_sizes(extra, size, compressed)
+
+        trailing_sizes = bool(flags & 0x08)
+        if flags & 0x01 or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED) or (
+                method == zipfile.ZIP_STORED and trailing_sizes):
+            self.unsupported = True
+            return False
+
+        del self._buffer[:header_length]
+
+        path = self._target(name)
+        if name.endswith('/'):
+            os.makedirs(path, exist_ok = True)
+            return True
+
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        self._member = {
+            'path': path,
+            'file': open(path + '.part', 'wb'),
+            'crc': crc,
+            'remaining': compressed,
+            'trailing_sizes': trailing_sizes,
+            'zip64': zip64,
+            'running_crc': 0,
+            'inflate': zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+        }
+        return True
+
+    def _zip64_sizes(self, extra, size, compressed):
+        position = 0
+        while position + 4 <= len(extra):
+            tag, length = struct.unpack('<HH', extra[position:position + 4])
+            if tag == 0x0001:
+                fields = extra[position + 4:position + 4 + length]
+                values = list(struct.unpack(f'<{len(fields) // 8}Q', fields[:len(fields) // 8 * 8]))
+                if size == 0xFFFFFFFF and values:
+                    size = values.pop(0)
+                if compressed == 0xFFFFFFFF and values:
+                    compressed = values.pop(0)
+                return size, compressed, True
+            position += 4 + length
+        return size, compressed, True
+
+    def _write(self, data):
+        member = self._member
+        member['file'].write(data)
+        member['running_crc'] = zlib.crc32(data, member['running_crc'])
+
+    def _continue_member(self):
+
+        member = self._member
+
+        if member['inflate'] is None or not member['trailing_sizes']:
+            #the compressed size is known from the header
+            if member['remaining'] > 0:
+                if not self._buffer:
+                    return False
+                take = min(member['remaining'], len(self._buffer))
+                chunk = bytes(self._buffer[:take])
+                del self._buffer[:take]
+                member['remaining'] -= take
+                self._write(chunk if member['inflate'] is None else member['inflate'].decompress(chunk))
+                if member['remaining'] > 0:
+                    return False
+            if member['inflate'] is not None:
+                self._write(member['inflate'].flush())
+            return self._finish_member(descriptor = member['trailing_sizes'])
+
+        #deflate with sizes after the data: inflate until the stream says it has ended
+        if not member['inflate'].eof:
+            if not self._buffer:
+                return False
+            chunk = bytes(self._buffer)
+            self._buffer.clear()
+            self._write(member['inflate'].decompress(chunk))
+            if not member['inflate'].eof:
+                return False
+            self._buffer[:0] = member['inflate'].unused_data
+        return self._finish_member(descriptor = True)
+
+    def _finish_member(self, descriptor):
+
+        member = self._member
+
+        if descriptor:
+            size_bytes = 8 if member['zip64'] else 4
+            length = 4 + 2 * size_bytes
+            if len(self._buffer) < 4:
+                return False
+            if bytes(self._buffer[:4]) == _DESCRIPTOR:
+                length += 4
+            if len(self._buffer) < length:
+                return False
+            crc = struct.unpack('<I', self._buffer[length - 4 - 2 * size_bytes:length - 2 * size_bytes])[0]
+            member['crc'] = crc
+            del self._buffer[:length]
+
+        member['file'].close()
+        if member['running_crc'] != member['crc']:
+            os.remove(member['path'] + '.part')
+            raise ChecksumError(f"CRC mismatch for zip member {member['path']}")
+
+        os.replace(member['path'] + '.part', member['path'])
+        self.extracted.append(member['path'])
+        self._member = None
+        return True
+
+    def close(self):
+        if self._member is not None:
+            self._member['file'].close()
+            self._remove_part(self._member['path'] + '.part')
+            self._member = None
+
+    def _remove_part(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+#the complete length from a 'bytes */1234' or 'bytes 0-99/1234' Content-Range header
+def _content_range_total(value):
+    total = (value or '').rpartition('/')[2].strip()
+    return int(total) if total.isdigit() else None
+
+def _hasher(checksum):
+    if checksum is None:
+        return None, None
+    algorithm, _, expected = checksum.partition(':')
+    if not expected:
+        algorithm, expected = 'sha256', algorithm
+    return hashlib.new(algorithm), expected.lower()
+
+#bounded-concurrency downloads over one pooled session: each job streams to '<path>.part',
+#resumes with a range request after a dropped connection, is checked against its checksum and
+#can be unzipped while it streams
+class ConcurrentFetcher:
+
+    def __init__(self, max_workers = 4, timeout = 60, max_retries = 3, chunk_size = 1 << 20, session = None):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.chunk_size = chunk_size
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections = max_workers, pool_maxsize = max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _read_state(self, part_path):
+        try:
+            with open(part_path + '.json') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_state(self, part_path, state):
+        with open(part_path + '.json', 'w') as f:
+            json.dump(state, f)
+
+    def _discard(self, part_path):
+        for path in (part_path, part_path + '.json'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    #a 416 only says the range starts at or past the end of the entity; the partial file is the whole
+    #download when the entity is exactly offset bytes long and still carries the validator stored when
+    #the partial file was started, taken from the 416 itself or else from a HEAD request
+    def _partial_is_complete(self, job, response, offset, state):
+
+        total = _content_range_total(response.headers.get('Content-Range'))
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        if total is None or not (etag or last_modified):
+            head = self.session.head(job.url, allow_redirects = True, timeout = self.timeout)
+            if not head.ok:
+                return False
+            length = head.headers.get('Content-Length', '')
+            if total is None and length.isdigit():
+                total = int(length)
+            etag = etag or head.headers.get('ETag')
+            last_modified = last_modified or head.headers.get('Last-Modified')
+
+        if total != offset:
+            return False
+        if state.get('etag'):
+            return etag == state['etag']
+        if state.get('last_modified'):
+            return last_modified == state['last_modified']
+        return True
+
+    #replaying what is already on disk through the hash and the unzipper before asking for the rest
+    def _replay(self, part_path, hasher, unzipper):
+        offset = 0
+        if not os.path.exists(part_path):
+            return offset
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(self.chunk_size), b''):
+                offset += len(block)
+                if hasher is not None:
+                    hasher.update(block)
+                if unzipper is not None:
+                    unzipper.feed(block)
+        return offset
+
+    def _verify(self, job, path):
+        hasher, expected = _hasher(job.checksum)
+        if hasher is None:
+            return None
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.chunk_size), b''):
+                hasher.update(block)
+        return hasher.hexdigest() if hasher.hexdigest() == expected else False
+
+    #one attempt: continue the partial file from where it stopped, or start over when the server
+    #ignores the range or the file changed upstream
+    def _attempt(self, job, part_path):
+
+        hasher, _ = _hasher(job.checksum)
+        unzipper = StreamingUnzipper(job.extract_to) if job.extract_to else None
+        state = self._read_state(part_path)
+        offset = self._replay(part_path, hasher, unzipper) if state.get('url') == job.url else 0
+        resumed_from = offset
+
+        headers = {}
+        if offset:
+            headers['Range'] = f'bytes={offset}-'
+            validator = state.get('etag') or state.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+
+        try:
+            with self.session.get(job.url, headers = headers, stream = True, timeout = self.timeout) as response:
+                if response.status_code == 416 and offset:
+                    if self._partial_is_complete(job, response, offset, state):
+                        return offset, resumed_from, hasher, unzipper, state
+                    #the partial file cannot be trusted, so the download starts over from zero
+                    if unzipper is not None:
+                        unzipper.close()
+                    response.close()
+                    self._discard(part_path)
+                    return self._attempt(job, part_path)
+                response.raise_for_status()
+
+                if offset and response.status_code != 206:
+                    #full body: drop what we had and start from zero
+                    if unzipper is not None:
+                        unzipper.close()
+                    hasher, _ = _hasher(job.checksum)
+                    unzipper = StreamingUnzipper(job.extract_to) if job.extract_to else None
+                    offset = resumed_from = 0
+
+                state = {
+                    'url': job.url,
+                    'etag': response.headers.get('ETag'),
+                    'last_modified': response.headers.get('Last-Modified'),
+                }
+                self._write_state(part_path, state)
+
+                with open(part_path, 'ab' if offset else 'wb') as f:
+                    for block in response.iter_content(chunk_size = self.chunk_size):
+                        f.write(block)
+                        offset += len(block)
+                        if hasher is not None:
+                            hasher.update(block)
+                        if unzipper is not None:
+                            unzipper.feed(block)
+        except BaseException:
+            if unzipper is not None:
+                unzipper.close()
+            raise
+
+        return offset, resumed_from, hasher, unzipper, state
+
+    def fetch(self, job):
+
+        job = FetchJob(*job)
+        directory = os.path.dirname(job.path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+        #a finished file that still matches its checksum is not downloaded again
+        if os.path.exists(job.path) and job.checksum is not None and self._verify(job, job.path):
+            extracted = self._extract_finished(job) if job.extract_to else []
+            return FetchResult(job.url, job.path, os.path.getsize(job.path), None, job.checksum, extracted)
+
+        part_path = job.path + '.part'
+        for attempt in range(self.max_retries + 1):
+            try:
+                size, resumed_from, hasher, unzipper, state = self._attempt(job, part_path)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.max_retries:
+                    raise
+
+        digest = None
+        if hasher is not None:
+            _, expected = _hasher(job.checksum)
+            digest = hasher.hexdigest()
+            if digest != expected:
+                os.remove(part_path)
+                os.remove(part_path + '.json')
+                raise ChecksumError(f'{job.url}: expected {expected}, got {digest}')
+
+        os.replace(part_path, job.path)
+        os.remove(part_path + '.json')
+
+        extracted = []
+        if unzipper is not None:
+            unzipper.close()
+            if unzipper.done and not unzipper.unsupported:
+                extracted = unzipper.extracted
+            else:
+                extracted = self._extract_finished(job)
+
+        return FetchResult(job.url, job.path, size, resumed_from or None, digest, extracted,
+                           state.get('etag'), state.get('last_modified'))
+
+    def _extract_finished(self, job):
+        with zipfile.ZipFile(job.path) as z:
+            z.extractall(job.extract_to)
+            return [os.path.join(job.extract_to, name) for name in z.namelist() if not name.endswith('/')]
+
+    #every job with at most max_workers downloads in flight, results in job order
+    def fetch_all(self, jobs):
+        jobs = [FetchJob(*job) for job in jobs]
+        with ThreadPoolExecutor(max_workers = self.max_workers) as ex:
+            return list(ex.map(self.fetch, jobs))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from energyCube import SedsCube
+from sedsCache import DownloadCache, load_seds_cached
+from sedsLoader import SEDS_URL
+
+MANIFEST_NAME = 'manifest.json'
+VALUES_NAME = 'values.npy'
+
+#writing a cube as a directory holding an MSN-major .npy array and a JSON manifest of its axes;
+#each MSN is one contiguous (state, year) block, so reading a few columns touches only their pages
+def write_cube_store(cube, path, dtype = np.float32):
+
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors = True)
+    os.makedirs(tmp_path)
+
+    shape = (len(cube.msns), len(cube.states), len(cube.years))
+    values = np.lib.format.open_memmap(os.path.join(tmp_path, VALUES_NAME), mode = 'w+', dtype = dtype, shape = shape)
+    for i in range(shape[0]):
+        values[i] = cube.values[:, :, i]
+    values.flush()
+    del values
+
+    manifest = {
+        'state_name': cube.states.name,
+        'states': [str(state) for state in cube.states],
+        'years': [int(year) for year in cube.years],
+        'msns': [str(msn) for msn in cube.msns],
+        'dtype': np.dtype(dtype).str,
+        'shape': list(shape),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+
+    shutil.rmtree(path, ignore_errors = True)
+    os.replace(tmp_path, path)
+    return path
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+#opening a store read-only: the array is memory-mapped, so opening costs one small JSON read and
+#every process that opens the same store shares its pages through the OS page cache
+def open_cube_store(path, msns = None):
+
+    manifest = read_manifest(path)
+    values = np.load(os.path.join(path, VALUES_NAME), mmap_mode = 'r')
+
+    if msns is None:
+        selected = manifest['msns']
+    else:
+        positions = {msn: i for i, msn in enumerate(manifest['msns'])}
+        selected = list(msns)
+        missing = [msn for msn in selected if msn not in positions]
+        if missing:
+            raise KeyError(f'MSN codes not in the store: {missing}')
+        #only the requested MSN blocks are read off the map
+        values = values[[positions[msn] for msn in selected]]
+
+    return SedsCube(values.transpose(1, 2, 0), manifest['states'], manifest['years'], selected,
+                    state_name = manifest['state_name'])
+
+#the full SEDS history as a memory-mapped store built once per download, next to the cached Parquet copy
+def load_cube_cached(url = SEDS_URL, cache = None, msn_codes = None):
+
+    cache = cache or DownloadCache()
+
+    def build(payload_path):
+        return SedsCube.from_long(load_seds_cached(url, cache), dtype = np.float32)
+
+    return open_cube_store(cache.parsed(url, 'cube', build, write_cube_store), msns = msn_codes)
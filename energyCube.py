@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+from pipelineTrace import traced
+
+#dense (state, year, MSN) array built from the long SEDS rows with one scatter instead of a pivot per year
+class SedsCube:
+
+    def __init__(self, values, states, years, msns, state_name = 'STUSPS'):
+        self.values = values
+        self.states = pd.Index(states, name = state_name)
+        self.years = pd.Index(years, name = 'Year')
+        self.msns = pd.Index(msns, name = 'MSN')
+
+    @classmethod
+    @traced('pivot')
+    def from_long(cls, df, state_column = 'StateCode', state_name = 'STUSPS', dtype = np.float64):
+
+        #factorizing each key once gives the cube coordinates of every row
+        state_codes, states = pd.factorize(df[state_column], sort = True)
+        year_codes, years = pd.factorize(df['Year'], sort = True)
+        msn_codes, msns = pd.factorize(df['MSN'], sort = True)
+
+        values = np.full((len(states), len(years), len(msns)), np.nan, dtype = dtype)
+        flat = np.ravel_multi_index((state_codes, year_codes, msn_codes), values.shape)
+
+        #a repeated (state, year, MSN) would silently overwrite the earlier value, so like pivot it is an error
+        seen = np.zeros(values.size, dtype = bool)
+        seen[flat] = True
+        if np.count_nonzero(seen) != len(flat):
+            first = pd.Index(flat).duplicated()
+            row = df.iloc[int(np.flatnonzero(first)[0])]
+            raise ValueError(
+                f'{int(first.sum())} duplicate (state, year, MSN) rows in the SEDS data, e.g. '
+                f"({row[state_column]}, {row['Year']}, {row['MSN']})"
+            )
+
+        values.flat[flat] = df['Data'].to_numpy()
+
+        return cls(values, np.asarray(states), np.asarray(years), np.asarray(msns), state_name)
+
+    #the cube without the given states, e.g. the continental subset
+    def without_states(self, states):
+        keep = ~self.states.isin(list(states))
+        return SedsCube(self.values[keep], self.states[keep], self.years, self.msns, self.states.name)
+
+    #one year as a STUSPS x MSN frame that shares memory with the cube
+    def year_frame(self, year):
+        return pd.DataFrame(
+            self.values[:, self.years.get_loc(year), :],
+            index = self.states,
+            columns = self.msns,
+            copy = False
+        )
+
+    #dictionary of yearly frames in the same shape as the old per-year pivot loop
+    def yearly_frames(self):
+        return {int(year): self.year_frame(year) for year in self.years}
+
+    #(STUSPS, Year) x MSN frame, the same layout as pivoting the long rows on both keys
+    def to_frame(self):
+        index = pd.MultiIndex.from_product([self.states, self.years])
+        return pd.DataFrame(
+            self.values.reshape(len(self.states) * len(self.years), len(self.msns)),
+            index = index,
+            columns = self.msns,
+            copy = False
+        )
+
+#pivoting the long SEDS rows once and returning the per-year STUSPS x MSN frames
+def yearly_pivots(df, state_column = 'StateCode'):
+    return SedsCube.from_long(df, state_column = state_column).yearly_frames()
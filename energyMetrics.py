@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from energyCube import SedsCube
+from metricRegistry import DEFAULT_REGISTRY
+from pipelineTrace import traced
+
+#columns calculate_energy_metrics returns by default
+DEFAULT_METRICS = ['total_pop', 'fossilfueltotal', 'fossil_GWh_total', 'fossil_GWh_percap',
+                   'coal_emiss', 'diesel_emiss', 'natgas_emiss', 'total_emissions',
+                   'coal_emiss_percap', 'diesel_emiss_percap', 'natgas_emiss_percap',
+                   'coal_GWh_total', 'diesel_GWh_total', 'natgas_GWh_total',
+                   'solar_GWh_total', 'nuclear_GWh_total', 'hydro_GWh_total',
+                   'geo_GWh_total', 'wind_GWh_total', 'coal_GWh_percap',
+                   'diesel_GWh_percap', 'natgas_GWh_percap', 'solar_GWh_percap',
+                   'nuclear_GWh_percap', 'hydro_GWh_percap', 'geo_GWh_percap',
+                   'wind_GWh_percap']
+
+#MSN series read by the requested metrics
+def metric_inputs(metrics = None, registry = DEFAULT_REGISTRY):
+    return registry.required_inputs(DEFAULT_METRICS if metrics is None else list(metrics))
+
+#computing the requested metrics (and only what they depend on) for a (rows, MSN) array
+def compute_metrics(values, msns, metrics = None, registry = DEFAULT_REGISTRY):
+    return registry.evaluate(values, msns, DEFAULT_METRICS if metrics is None else list(metrics))
+
+#metrics for every (state, year) in a cube, skipping combinations with no SEDS data at all
+@traced('metrics')
+def cube_metrics(cube, metrics = None, registry = DEFAULT_REGISTRY):
+
+    metrics = DEFAULT_METRICS if metrics is None else list(metrics)
+    msn_positions = {msn: i for i, msn in enumerate(cube.msns)}
+
+    #absent series are left out here so evaluate can report them per metric
+    inputs = [msn for msn in metric_inputs(metrics, registry) if msn in msn_positions]
+
+    #only the MSN columns the metrics read are gathered out of the (possibly very wide) cube, before
+    #reshaping, since a memory-mapped store's transposed view would otherwise be copied whole
+    x = cube.values[:, :, [msn_positions[msn] for msn in inputs]].reshape(len(cube.states) * len(cube.years), len(inputs))
+    present = ~np.isnan(x).all(axis = 1)
+
+    index = pd.MultiIndex.from_product([cube.states, cube.years])[present]
+
+    return pd.DataFrame(
+        registry.evaluate(x[present], inputs, metrics),
+        index = index,
+        columns = metrics,
+        copy = False
+    )
+
+#metrics for a long SEDS frame or one already pivoted to (STUSPS, Year) x MSN, without touching it
+def energy_metrics(df, metrics = None, registry = DEFAULT_REGISTRY):
+
+    if 'MSN' in df.columns:
+        state_column = 'StateCode' if 'StateCode' in df.columns else 'STUSPS'
+        return cube_metrics(SedsCube.from_long(df, state_column = state_column), metrics, registry)
+
+    metrics = DEFAULT_METRICS if metrics is None else list(metrics)
+    inputs = [msn for msn in metric_inputs(metrics, registry) if msn in df.columns]
+
+    return pd.DataFrame(
+        registry.evaluate(df[inputs].to_numpy(dtype = np.float64), inputs, metrics),
+        index = df.index,
+        columns = metrics,
+        copy = False
+    )
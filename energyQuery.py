@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from metricRegistry import DEFAULT_REGISTRY
+
+#state groupings used across the scripts
+REGIONS = {
+    'southeast': ['GA', 'FL', 'TN', 'NC', 'SC', 'AL', 'MS'],
+}
+
+#(STUSPS, Year) index over the metrics table, built once and shared by exporters and charts
+class EnergyQuery:
+
+    def __init__(self, metrics_df, regions = None, registry = DEFAULT_REGISTRY):
+
+        #a lexsorted index keeps every state's rows contiguous and its years ascending
+        frame = metrics_df if metrics_df.index.is_monotonic_increasing else metrics_df.sort_index()
+
+        self.frame = frame
+        self.values = frame.to_numpy()
+        self.regions = dict(REGIONS if regions is None else regions)
+        self.registry = registry
+
+        states = frame.index.get_level_values(0)
+        self._years = np.asarray(frame.index.get_level_values(1))
+
+        starts = np.flatnonzero(np.r_[True, states[1:] != states[:-1]])
+        stops = np.r_[starts[1:], len(states)]
+        self._state_slices = {states[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+        self._column_positions = {column: i for i, column in enumerate(frame.columns)}
+        self._aggregates = {}
+
+    @property
+    def states(self):
+        return list(self._state_slices)
+
+    def region_states(self, region):
+        try:
+            return self.regions[region]
+        except KeyError:
+            raise KeyError(f'Unknown region {region!r}, expected one of {list(self.regions)}') from None
+
+    #row positions for the states and years, found by slicing each state's block
+    def _positions(self, states, years):
+
+        blocks = []
+        for state in states:
+            if state not in self._state_slices:
+                continue
+            start, stop = self._state_slices[state]
+            state_years = self._years[start:stop]
+
+            if years is None:
+                blocks.append(np.arange(start, stop))
+            elif isinstance(years, slice):
+                first = 0 if years.start is None else np.searchsorted(state_years, years.start, 'left')
+                last = len(state_years) if years.stop is None else np.searchsorted(state_years, years.stop, 'right')
+                block = np.arange(start + first, start + last)
+                #a step counts calendar years from the slice start (or the state's first year)
+                if years.step is not None and len(block):
+                    origin = state_years[first] if years.start is None else years.start
+                    block = block[(self._years[block] - origin) % years.step == 0]
+                blocks.append(block)
+            else:
+                wanted = np.unique(np.asarray(list(years)))
+                found = np.searchsorted(state_years, wanted)
+                found = found[found < len(state_years)]
+                blocks.append(start + found[np.isin(state_years[found], wanted)])
+
+        return np.concatenate(blocks) if blocks else np.array([], dtype = np.intp)
+
+    #rows for a set of states (or a region), years (list or inclusive slice, e.g. slice(1990, 2020, 5)) and metrics
+    def select(self, states = None, years = None, region = None, metrics = None):
+
+        _check_step(years)
+        if region is not None:
+            states = self.region_states(region)
+        if states is None:
+            states = self.states
+        elif isinstance(states, str):
+            states = [states]
+
+        return self._take(self._positions(states, years), metrics)
+
+    #rows for a different set of years per state, e.g. {'GA': [2000, 2010], 'FL': slice(1990, None)}
+    def select_pairs(self, state_years, metrics = None):
+
+        for years in state_years.values():
+            _check_step(years)
+        positions = np.concatenate(
+            [self._positions([state], years) for state, years in state_years.items()] +
+            [np.array([], dtype = np.intp)]
+        )
+        return self._take(positions, metrics)
+
+    #gathering rows and (optionally) a subset of metric columns straight from the shared array
+    def _take(self, positions, metrics):
+
+        if metrics is None:
+            return self.frame.iloc[positions]
+
+        columns = [self._column_positions[metric] for metric in metrics]
+        return pd.DataFrame(self.values[np.ix_(positions, columns)],
+                            index = self.frame.index[positions], columns = list(metrics))
+
+    #one state's rows indexed by Year, as a slice of the shared table
+    def state(self, state):
+        start, stop = self._state_slices[state]
+        return self.frame.iloc[start:stop].droplevel(0)
+
+    #how a column adds up across states: 'total' for raw series and linear metrics, 'ratio' for ratios
+    #whose numerator and denominator are both totals in the table, None when a sum means nothing
+    def _sum_kind(self, column):
+        metric = self.registry.metrics.get(column)
+        if metric is None or metric.kind == 'linear':
+            return 'total'
+        if metric.kind == 'ratio' and all(
+            operand in self._column_positions and self._sum_kind(operand) == 'total' for operand in metric.inputs
+        ):
+            return 'ratio'
+        return None
+
+    #per-year region values: totals are summed (NaN where no state reported) and ratios, e.g. per capita
+    #figures, are recomputed from the summed numerator and denominator over the states reporting both;
+    #regionalAggregation.regional_metrics aggregates through here, so both give the same region values
+    def _region_sums(self, states, metrics):
+
+        kinds = {metric: self._sum_kind(metric) for metric in metrics}
+        unsummable = [metric for metric, kind in kinds.items() if kind is None]
+        if unsummable:
+            raise ValueError(f'{unsummable} cannot be summed across states and their operands '
+                             f'{sorted({operand for metric in unsummable for operand in self.registry[metric].inputs})} '
+                             f'are not all totals in the table; include them or use another reduction')
+
+        columns = {metric for metric in metrics if kinds[metric] == 'total'}
+        columns.update(operand for metric in metrics if kinds[metric] == 'ratio'
+                       for operand in self.registry[metric].inputs)
+        rows = self.select(states = states, metrics = sorted(columns))
+        totals = rows.groupby(level = 1).sum(min_count = 1)
+
+        result = {}
+        for metric in metrics:
+            if kinds[metric] == 'total':
+                result[metric] = totals[metric]
+                continue
+            numerator, denominator = self.registry[metric].inputs
+            both = rows[numerator].notna() & rows[denominator].notna()
+            result[metric] = (rows[numerator].where(both).groupby(level = 1).sum(min_count = 1) /
+                              rows[denominator].where(both).groupby(level = 1).sum(min_count = 1))
+
+        return pd.DataFrame(result, index = totals.index)
+
+    #per-year sums (or another reduction) over a region, cached for reuse; by default a sum covers the
+    #columns that add up across states, including the recomputed ratios
+    def aggregate(self, region, metrics = None, how = 'sum'):
+
+        if metrics is None:
+            metrics = [column for column in self.frame.columns if how != 'sum' or self._sum_kind(column)]
+        metrics = tuple(metrics)
+        key = (region if isinstance(region, str) else tuple(region), metrics, how)
+
+        if key not in self._aggregates:
+            states = self.region_states(region) if isinstance(region, str) else list(region)
+            if how == 'sum':
+                self._aggregates[key] = self._region_sums(states, list(metrics))
+            else:
+                rows = self.select(states = states, metrics = list(metrics))
+                self._aggregates[key] = rows.groupby(level = 1).agg(how)
+
+        return self._aggregates[key]
+
+def _check_step(years):
+    if isinstance(years, slice) and years.step is not None and years.step <= 0:
+        raise ValueError(f'Year slices step forwards, got step {years.step}')
@@ -0,0 +1,187 @@
+import os
+import sqlite3
+
+import pandas as pd
+
+from pipelineTrace import traced
+
+#quoting a column or table name for sqlite
+def _quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+#writing the state geometries once and every year's attributes into one (state, year) table, with a view per year
+@traced('geopackage', output = lambda result, arguments: arguments['gpk_path'])
+def write_yearly_geopackage(gpk_path, states_gdf, yearly_dfs, layer_prefix = 'SEDS_States',
+                            key = 'STUSPS', geometry_layer = 'states', attributes_table = 'yearly_attributes'):
+
+    if os.path.exists(gpk_path):
+        os.remove(gpk_path)
+
+    #the geometry table is written and spatially indexed by GDAL exactly once
+    geometry_columns = [column for column in states_gdf.columns if column != states_gdf.geometry.name]
+    states_gdf.to_file(gpk_path, layer = geometry_layer, driver = 'GPKG')
+
+    years, value_columns, records = _yearly_records(yearly_dfs, key, geometry_columns)
+
+    connection = sqlite3.connect(gpk_path)
+    try:
+        with connection:
+            cursor = connection.cursor()
+
+            value_definitions = ''.join(f', {_quote(column)} REAL' for column in value_columns)
+            cursor.execute(
+                f'CREATE TABLE {_quote(attributes_table)} ('
+                f'fid INTEGER PRIMARY KEY AUTOINCREMENT, {_quote(key)} TEXT NOT NULL, '
+                f'"Year" INTEGER NOT NULL{value_definitions})'
+            )
+            _insert_records(cursor, attributes_table, key, value_columns, records)
+            cursor.execute(
+                f'CREATE UNIQUE INDEX {_quote(attributes_table + "_key")} '
+                f'ON {_quote(attributes_table)} ({_quote(key)}, "Year")'
+            )
+            cursor.execute(
+                "INSERT INTO gpkg_contents (table_name, data_type, identifier) VALUES (?, 'attributes', ?)",
+                (attributes_table, attributes_table)
+            )
+
+            _create_year_views(cursor, years, layer_prefix, key, geometry_layer, attributes_table,
+                               geometry_columns, value_columns)
+    finally:
+        connection.close()
+
+    return [f'{layer_prefix}{year}' for year in years]
+
+#the years that have a {layer_prefix}{year} layer in a GeoPackage; empty when the file is missing
+def yearly_layer_years(gpk_path, layer_prefix = 'SEDS_States'):
+
+    if not os.path.exists(gpk_path):
+        return set()
+
+    connection = sqlite3.connect(gpk_path)
+    try:
+        names = [row[0] for row in connection.execute(
+            "SELECT table_name FROM gpkg_contents WHERE data_type = 'features' AND table_name LIKE ?",
+            (layer_prefix + '%',)
+        )]
+    except sqlite3.DatabaseError:
+        return set()
+    finally:
+        connection.close()
+
+    return {int(name[len(layer_prefix):]) for name in names if name[len(layer_prefix):].isdigit()}
+
+#replacing (or adding) some years and dropping others in a GeoPackage from write_yearly_geopackage,
+#without touching the geometry table or the other years; returns None when the yearly columns no
+#longer match the attributes table, in which case the file has to be written again in full
+@traced('geopackage_update', output = lambda result, arguments: arguments['gpk_path'] if result else None)
+def update_yearly_geopackage(gpk_path, yearly_dfs, removed_years = (), layer_prefix = 'SEDS_States',
+                             key = 'STUSPS', geometry_layer = 'states', attributes_table = 'yearly_attributes'):
+
+    connection = sqlite3.connect(gpk_path)
+    try:
+        with connection:
+            cursor = connection.cursor()
+
+            geometry_name = cursor.execute(
+                'SELECT column_name FROM gpkg_geometry_columns WHERE table_name = ?', (geometry_layer,)
+            ).fetchone()[0]
+            geometry_columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({_quote(geometry_layer)})')
+                                if row[1] not in ('fid', geometry_name)]
+            table_columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({_quote(attributes_table)})')
+                             if row[1] not in ('fid', key, 'Year')]
+
+            years, value_columns, records = _yearly_records(yearly_dfs, key, geometry_columns)
+            if years and value_columns != table_columns:
+                return None
+
+            #years that already have a view; a written year without one (e.g. dropped by hand) gets it back
+            existing = {int(row[0][len(layer_prefix):]) for row in cursor.execute(
+                "SELECT table_name FROM gpkg_contents WHERE data_type = 'features' AND table_name LIKE ?",
+                (layer_prefix + '%',)
+            ) if row[0][len(layer_prefix):].isdigit()}
+
+            replaced = [int(year) for year in removed_years] + years
+            cursor.executemany(f'DELETE FROM {_quote(attributes_table)} WHERE "Year" = ?', [(year,) for year in replaced])
+            if years:
+                _insert_records(cursor, attributes_table, key, value_columns, records)
+
+            #removed years lose their layer, and whatever is left of a half-removed layer is cleared before
+            #its view is created again
+            created = [year for year in years if year not in existing]
+            for year in [int(year) for year in removed_years] + created:
+                layer_name = f'{layer_prefix}{year}'
+                cursor.execute(f'DROP VIEW IF EXISTS {_quote(layer_name)}')
+                cursor.execute('DELETE FROM gpkg_geometry_columns WHERE table_name = ?', (layer_name,))
+                cursor.execute('DELETE FROM gpkg_contents WHERE table_name = ?', (layer_name,))
+
+            _create_year_views(cursor, created, layer_prefix, key, geometry_layer, attributes_table,
+                               geometry_columns, table_columns)
+    finally:
+        connection.close()
+
+    return [f'{layer_prefix}{year}' for year in years]
+
+#stacking the yearly frames into one long (state, year) table of sqlite-ready rows
+def _yearly_records(yearly_dfs, key, geometry_columns):
+
+    years = sorted(int(year) for year in yearly_dfs)
+    if not years:
+        return years, [], None
+
+    attributes = pd.concat(
+        [yearly_dfs[year] for year in sorted(yearly_dfs, key = int)],
+        keys = years,
+        names = ['Year', key]
+    )
+    attributes = attributes.reset_index()
+    value_columns = [column for column in attributes.columns if column not in ('Year', key)]
+
+    #geometry table columns win if a yearly column has the same name
+    value_columns = [column for column in value_columns if column not in geometry_columns]
+
+    records = attributes[[key, 'Year'] + value_columns].astype(object)
+    records = records.where(records.notna(), None)
+    return years, value_columns, records
+
+def _insert_records(cursor, attributes_table, key, value_columns, records):
+    placeholders = ', '.join('?' * (len(value_columns) + 2))
+    insert_columns = ', '.join(_quote(column) for column in [key, 'Year'] + value_columns)
+    cursor.executemany(
+        f'INSERT INTO {_quote(attributes_table)} ({insert_columns}) VALUES ({placeholders})',
+        records.itertuples(index = False, name = None)
+    )
+
+#one spatial view per year, registered so GIS applications list it as a layer
+def _create_year_views(cursor, years, layer_prefix, key, geometry_layer, attributes_table,
+                       geometry_columns, value_columns):
+
+    geometry_name, geometry_type, srs_id, z, m = cursor.execute(
+        'SELECT column_name, geometry_type_name, srs_id, z, m FROM gpkg_geometry_columns WHERE table_name = ?',
+        (geometry_layer,)
+    ).fetchone()
+    extent = cursor.execute(
+        'SELECT min_x, min_y, max_x, max_y FROM gpkg_contents WHERE table_name = ?', (geometry_layer,)
+    ).fetchone()
+
+    select_columns = ', '.join(
+        ['g.fid AS fid'] +
+        [f'g.{_quote(column)}' for column in geometry_columns + [geometry_name]] +
+        [f'a.{_quote(column)}' for column in value_columns]
+    )
+    for year in years:
+        layer_name = f'{layer_prefix}{year}'
+        cursor.execute(
+            f'CREATE VIEW {_quote(layer_name)} AS SELECT {select_columns} '
+            f'FROM {_quote(geometry_layer)} AS g LEFT JOIN {_quote(attributes_table)} AS a '
+            f'ON a.{_quote(key)} = g.{_quote(key)} AND a."Year" = {year}'
+        )
+        cursor.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) "
+            "VALUES (?, 'features', ?, ?, ?, ?, ?, ?)",
+            (layer_name, layer_name, *extent, srs_id)
+        )
+        cursor.execute(
+            'INSERT INTO gpkg_geometry_columns (table_name, column_name, geometry_type_name, srs_id, z, m) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (layer_name, geometry_name, geometry_type, srs_id, z, m)
+        )
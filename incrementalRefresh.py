@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from energyMetrics import DEFAULT_METRICS, metric_inputs
+from geopackageWriter import update_yearly_geopackage, write_yearly_geopackage, yearly_layer_years
+from metricRegistry import DEFAULT_REGISTRY
+from pipelineTrace import traced
+from sedsFunctions import export_state_energy_data
+
+MANIFEST_NAME = 'manifest.json'
+METRICS_NAME = 'metrics.parquet'
+
+def _digest(*parts):
+    h = hashlib.blake2b(digest_size = 16)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+#hash of every (state, year) slice of the cube across all of its MSN series; None where the slice is empty
+def slice_fingerprints(cube):
+
+    rows = np.ascontiguousarray(cube.values.reshape(-1, len(cube.msns)))
+    present = ~np.isnan(rows).all(axis = 1)
+    columns = _digest(*cube.msns)
+
+    fingerprints = np.full(len(rows), None, dtype = object)
+    for i in np.flatnonzero(present):
+        fingerprints[i] = _digest(columns, rows[i].tobytes())
+
+    return fingerprints.reshape(len(cube.states), len(cube.years))
+
+#hash of the metric definitions, so editing a formula or unit invalidates everything computed with it
+def definitions_fingerprint(metrics, registry = DEFAULT_REGISTRY):
+    parts = []
+    for level in registry.levels(metrics):
+        for metric in sorted(level, key = lambda metric: metric.name):
+            formula = None if metric.formula is None else metric.formula.__code__.co_code
+            parts += [metric.name, metric.kind, metric.inputs, metric.weights, metric.units, formula]
+    return _digest(*metrics, *parts)
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'definitions': None, 'slices': {}, 'csv': {}, 'layers': {}}
+
+def save_manifest(output_dir, manifest):
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent = 1, sort_keys = True)
+    os.replace(path + '.tmp', path)
+
+def _csv_path(output_dir, state):
+    return os.path.join(output_dir, f'{state}_energy_data.csv')
+
+#recomputing metrics and rewriting per-state csvs and yearly layers only where their input slices changed;
+#write_year_layers(years, removed_years) updates the yearly layers and returns the years it wrote, which
+#can be more than it was asked for when it had to rebuild everything; a writer with a target (naming the
+#file and layers it keeps) and existing_years() has its layer hashes kept per target, and every year is
+#written again when a layer recorded as written is missing, e.g. because the file was deleted
+@traced('refresh', output = lambda result, arguments: [_csv_path(arguments['output_dir'], state) for state in result['csv']])
+def incremental_refresh(cube, output_dir, state_codes = None, write_year_layers = None,
+                        metrics = None, registry = DEFAULT_REGISTRY):
+
+    metrics = DEFAULT_METRICS if metrics is None else list(metrics)
+    os.makedirs(output_dir, exist_ok = True)
+
+    manifest = load_manifest(output_dir)
+    definitions = definitions_fingerprint(metrics, registry)
+
+    fingerprints = slice_fingerprints(cube)
+    present = np.array([fingerprint is not None for fingerprint in fingerprints.ravel()])
+    index = pd.MultiIndex.from_product([cube.states, cube.years])[present]
+    keys = [f'{state}|{year}' for state, year in index]
+    hashes = list(fingerprints.ravel()[present])
+
+    #a slice is stale when its input changed or the metric definitions did
+    metrics_path = os.path.join(output_dir, METRICS_NAME)
+    reuse = manifest['definitions'] == definitions and os.path.exists(metrics_path)
+    previous = manifest['slices'] if reuse else {}
+    stale = np.array([previous.get(key) != h for key, h in zip(keys, hashes)], dtype = bool)
+
+    values = np.full((len(index), len(metrics)), np.nan)
+    if reuse and not stale.all():
+        cached = pd.read_parquet(metrics_path)
+        values[~stale] = cached.reindex(index)[metrics].to_numpy()[~stale]
+
+    if stale.any():
+        msn_positions = {msn: i for i, msn in enumerate(cube.msns)}
+        inputs = [msn for msn in metric_inputs(metrics, registry) if msn in msn_positions]
+        x = cube.values[:, :, [msn_positions[msn] for msn in inputs]]
+        x = x.reshape(len(cube.states) * len(cube.years), len(inputs))[present]
+        values[stale] = registry.evaluate(x[stale], inputs, metrics)
+
+    metrics_df = pd.DataFrame(values, index = index, columns = metrics, copy = False)
+    if not reuse or stale.any() or len(index) != len(manifest['slices']):
+        metrics_df.to_parquet(metrics_path)
+
+    #outputs carry the hash of the slices they were produced from
+    state_hashes = {}
+    year_hashes = {}
+    for (state, year), key in zip(index, hashes):
+        state_hashes.setdefault(state, []).append(key)
+        year_hashes.setdefault(int(year), []).append(key)
+    state_hashes = {state: _digest(definitions, *parts) for state, parts in state_hashes.items()}
+    year_hashes = {str(year): _digest(definitions, *parts) for year, parts in year_hashes.items()}
+
+    state_codes = list(state_hashes) if state_codes is None else list(state_codes)
+    csv_states = [state for state in state_codes if state in state_hashes and (
+        manifest['csv'].get(state) != state_hashes[state] or not os.path.exists(_csv_path(output_dir, state))
+    )]
+    if csv_states:
+        export_state_energy_data(csv_states, metrics_df, output_dir)
+
+    #states that dropped out of the input lose their csv
+    removed_states = [state for state in manifest['csv'] if state not in state_hashes]
+    for state in removed_states:
+        if os.path.exists(_csv_path(output_dir, state)):
+            os.remove(_csv_path(output_dir, state))
+        del manifest['csv'][state]
+
+    layer_years, removed_years = [], []
+    if write_year_layers is not None:
+        #manifests from before layer hashes were kept per target hold {year: hash} and are started over
+        target = getattr(write_year_layers, 'target', '')
+        if any(not isinstance(hashes, dict) for hashes in manifest['layers'].values()):
+            manifest['layers'] = {}
+        layer_hashes = manifest['layers'].setdefault(target, {})
+
+        layer_years = [int(year) for year, h in year_hashes.items() if layer_hashes.get(year) != h]
+        removed_years = [int(year) for year in layer_hashes if year not in year_hashes]
+        written_before = {int(year) for year in layer_hashes if year in year_hashes}
+        if hasattr(write_year_layers, 'existing_years') and not written_before <= write_year_layers.existing_years():
+            layer_years = sorted(int(year) for year in year_hashes)
+
+        if layer_years or removed_years:
+            written = write_year_layers(layer_years, removed_years)
+            layer_years = layer_years if written is None else sorted(int(year) for year in written)
+        for year in removed_years:
+            del layer_hashes[str(year)]
+        layer_hashes.update({str(year): year_hashes[str(year)] for year in layer_years if str(year) in year_hashes})
+
+    manifest['definitions'] = definitions
+    manifest['slices'] = dict(zip(keys, hashes))
+    manifest['csv'].update({state: state_hashes[state] for state in csv_states})
+    save_manifest(output_dir, manifest)
+
+    return {
+        'metrics': metrics_df,
+        'recomputed': [key for key, is_stale in zip(keys, stale) if is_stale],
+        'csv': csv_states,
+        'removed_csv': removed_states,
+        'layers': layer_years,
+        'removed_layers': removed_years,
+    }
+
+#write_year_layers for incremental_refresh that keeps a write_yearly_geopackage file of the cube's years
+#current; states_gdf can be a function returning it, so the geometries are only read for a full rewrite
+class GeoPackageYearWriter:
+
+    def __init__(self, gpk_path, cube, states_gdf, layer_prefix = 'SEDS_States', level = 'full'):
+        self.gpk_path = gpk_path
+        self.cube = cube
+        self.states_gdf = states_gdf
+        self.layer_prefix = layer_prefix
+        self.level = level
+
+    #the file, layer names and geometry precision the manifest's layer hashes describe
+    @property
+    def target(self):
+        return f'{os.path.abspath(self.gpk_path)}|{self.layer_prefix}|{self.level}'
+
+    def existing_years(self):
+        return yearly_layer_years(self.gpk_path, self.layer_prefix)
+
+    def __call__(self, years, removed_years):
+
+        #only a file that already has every other year's layer is updated in place; when every year is
+        #stale (e.g. a new precision level) the geometry table is written again as well
+        expected = {int(year) for year in self.cube.years} - set(years)
+        if os.path.exists(self.gpk_path) and expected and expected <= self.existing_years():
+            yearly_dfs = {year: self.cube.year_frame(year) for year in years}
+            if update_yearly_geopackage(self.gpk_path, yearly_dfs, removed_years,
+                                        layer_prefix = self.layer_prefix) is not None:
+                return years
+
+        #no file yet, missing layers or different columns: every year is written again
+        directory = os.path.dirname(self.gpk_path)
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+        from stateGeometry import StateGeometry
+        if callable(self.states_gdf):
+            geometry = StateGeometry(loader = self.states_gdf)
+        else:
+            geometry = StateGeometry(self.states_gdf)
+        write_yearly_geopackage(self.gpk_path, geometry.get(self.level), self.cube.yearly_frames(),
+                                layer_prefix = self.layer_prefix)
+        return [int(year) for year in self.cube.years]
+
+def geopackage_year_writer(gpk_path, cube, states_gdf, layer_prefix = 'SEDS_States', level = 'full'):
+    return GeoPackageYearWriter(gpk_path, cube, states_gdf, layer_prefix, level)
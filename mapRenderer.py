@@ -0,0 +1,169 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.colors import Normalize
+
+from pipelineTrace import traced
+
+#states x years frame of one SEDS column from the dict of yearly frames, dropping years without data
+def yearly_series(yearly_dfs, column):
+    series = {year: df[column] for year, df in yearly_dfs.items() if column in df.columns}
+    values = pd.DataFrame(series)
+    return values.loc[:, values.notna().any()]
+
+#states x years frame of one derived metric from the (STUSPS, Year) metrics table
+def metric_series(metrics_df, metric):
+    values = metrics_df[metric].unstack('Year')
+    return values.loc[:, values.notna().any()]
+
+#figure, axes, state polygons and colorbar built once; each frame only swaps the face colors
+class ChoroplethFrames:
+
+    def __init__(self, states_gdf, norm, cmap = 'YlOrRd', label = '', xlim = None, ylim = None,
+                 figsize = (10, 6), missing_color = 'lightgrey'):
+
+        self.fig, self.ax = plt.subplots(1, 1, figsize = figsize)
+
+        states_gdf.plot(ax = self.ax, edgecolor = 'white', linewidth = 0.3)
+        self.collection = self.ax.collections[0]
+
+        cmap = plt.get_cmap(cmap).copy()
+        cmap.set_bad(missing_color)
+        self.collection.set_cmap(cmap)
+        self.collection.set_norm(norm)
+        self.collection.set_array(np.ma.masked_invalid(np.full(len(states_gdf), np.nan)))
+
+        self.fig.colorbar(self.collection, ax = self.ax, orientation = 'horizontal', label = label)
+
+        if xlim is not None:
+            self.ax.set_xlim(xlim)
+        if ylim is not None:
+            self.ax.set_ylim(ylim)
+        self.ax.set_axis_off()
+
+        self.bbox = None
+
+    def draw(self, values, title):
+        self.collection.set_array(np.ma.masked_invalid(values))
+        self.ax.set_title(title, fontdict = {'fontsize': 15})
+
+    #every frame is cropped to the same box so they line up in animations and sprite sheets
+    def save(self, path, dpi = 100):
+        if self.bbox is None:
+            self.fig.canvas.draw()
+            self.bbox = self.fig.get_tightbbox(self.fig.canvas.get_renderer()).padded(0.1)
+        self.fig.savefig(path, dpi = dpi, bbox_inches = self.bbox)
+
+    def close(self):
+        plt.close(self.fig)
+
+#rendering a run of years into one reused figure, redrawing only the state colors and title per year
+def _render_frames(states_gdf, matrix, years, paths, titles, norm, options):
+    frames = ChoroplethFrames(states_gdf, norm, **options['frame'])
+    try:
+        for column, year, path in zip(matrix.T, years, paths):
+            frames.draw(column, titles[year])
+            frames.save(path, dpi = options['dpi'])
+    finally:
+        frames.close()
+    return paths
+
+#rendering one value per state for every year with a shared color scale
+@traced('maps', output = lambda paths, arguments: paths)
+def render_map_series(states_gdf, values, path_pattern, title = '{year}', label = '', cmap = 'YlOrRd',
+                      xlim = None, ylim = None, key = 'STUSPS', workers = None, dpi = 100,
+                      animation = None, fps = 4, sprite_sheet = None, sprite_columns = 10):
+
+    years = list(values.columns)
+    matrix = values.reindex(states_gdf[key].to_numpy()).to_numpy(dtype = np.float64)
+
+    #one normalization across the whole series so colors are comparable between years
+    finite = matrix[np.isfinite(matrix)]
+    norm = Normalize(vmin = finite.min() if finite.size else 0, vmax = finite.max() if finite.size else 1)
+
+    paths = [path_pattern.format(year = year) for year in years]
+    titles = {year: title.format(year = year) for year in years}
+    for directory in {os.path.dirname(path) for path in paths}:
+        if directory:
+            os.makedirs(directory, exist_ok = True)
+
+    options = {
+        'frame': {'cmap': cmap, 'label': label, 'xlim': xlim, 'ylim': ylim},
+        'dpi': dpi,
+    }
+
+    if workers is None or workers <= 1:
+        _render_frames(states_gdf, matrix, years, paths, titles, norm, options)
+    else:
+        #each worker builds its own figure once and renders a contiguous run of years
+        chunks = [chunk for chunk in np.array_split(np.arange(len(years)), workers) if len(chunk)]
+        with ProcessPoolExecutor(max_workers = workers) as ex:
+            list(ex.map(
+                _render_frames,
+                [states_gdf] * len(chunks),
+                [matrix[:, chunk] for chunk in chunks],
+                [[years[i] for i in chunk] for chunk in chunks],
+                [[paths[i] for i in chunk] for chunk in chunks],
+                [titles] * len(chunks),
+                [norm] * len(chunks),
+                [options] * len(chunks),
+            ))
+
+    if animation is not None:
+        write_animation(paths, animation, fps = fps)
+    if sprite_sheet is not None:
+        write_sprite_sheet(paths, sprite_sheet, columns = sprite_columns)
+
+    return paths
+
+#stitching rendered frames into an animated GIF or (with ffmpeg on the path) an MP4
+def write_animation(frame_paths, output_path, fps = 4):
+
+    from PIL import Image
+
+    images = [Image.open(path).convert('RGB') for path in frame_paths]
+
+    if output_path.lower().endswith('.gif'):
+        images[0].save(output_path, save_all = True, append_images = images[1:],
+                       duration = int(1000 / fps), loop = 0)
+        return output_path
+
+    from matplotlib.animation import FFMpegWriter
+
+    width, height = images[0].size
+    fig = plt.figure(figsize = (width / 100, height / 100), dpi = 100)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    image = ax.imshow(np.asarray(images[0]))
+
+    writer = FFMpegWriter(fps = fps)
+    try:
+        with writer.saving(fig, output_path, dpi = 100):
+            for frame in images:
+                image.set_data(np.asarray(frame))
+                writer.grab_frame()
+    finally:
+        plt.close(fig)
+
+    return output_path
+
+#laying the frames out on a single PNG grid
+def write_sprite_sheet(frame_paths, output_path, columns = 10):
+
+    from PIL import Image
+
+    images = [Image.open(path) for path in frame_paths]
+    width, height = images[0].size
+    rows = -(-len(images) // columns)
+
+    sheet = Image.new('RGB', (width * min(columns, len(images)), height * rows), 'white')
+    for i, image in enumerate(images):
+        sheet.paste(image, ((i % columns) * width, (i // columns) * height))
+    sheet.save(output_path)
+
+    return output_path
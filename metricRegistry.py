@@ -0,0 +1,228 @@
+import numpy as np
+
+#conversion constants used by the derived metrics
+BTU_PER_KWH = 3412.14
+GWH_PER_BILLION_BTU = 1000 / BTU_PER_KWH
+CO2_COAL = 95.81 #kg CO2 per million Btu, so billion Btu * factor is metric tons
+CO2_DIESEL = 74.14
+CO2_NATGAS = 52.91
+
+#raised when a requested metric reads a SEDS series that is not in the input
+class MissingInputError(KeyError):
+
+    def __init__(self, missing):
+        self.missing = missing
+        details = '; '.join(f"'{name}' needs {', '.join(inputs)}" for name, inputs in missing.items())
+        super().__init__(f'SEDS series missing for the requested metrics: {details}')
+
+    def __str__(self):
+        return self.args[0]
+
+#one derived metric: the series or metrics it reads, how it combines them and its units
+class Metric:
+
+    def __init__(self, name, inputs, kind, units, description = '', weights = None, formula = None):
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.kind = kind
+        self.units = units
+        self.description = description
+        self.weights = None if weights is None else tuple(weights)
+        self.formula = formula
+
+    def __repr__(self):
+        return f'Metric({self.name!r}, inputs={list(self.inputs)}, units={self.units!r})'
+
+#named collection of metrics evaluated lazily in dependency order
+class MetricRegistry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def __contains__(self, name):
+        return name in self.metrics
+
+    def __getitem__(self, name):
+        return self.metrics[name]
+
+    def __iter__(self):
+        return iter(self.metrics)
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Metric {metric.name!r} is already registered')
+        self.metrics[metric.name] = metric
+        return metric
+
+    #weighted sum of series or other metrics, batched into one matrix product per level
+    def linear(self, name, weights, units, description = ''):
+        return self.register(Metric(name, weights.keys(), 'linear', units, description, weights = weights.values()))
+
+    #one operand divided by another, batched into one vectorized division per level
+    def ratio(self, name, numerator, denominator, units, description = ''):
+        return self.register(Metric(name, (numerator, denominator), 'ratio', units, description))
+
+    #a second name for a registered metric, evaluated the same way as the metric it stands for
+    def alias(self, name, target):
+        metric = self.metrics[target]
+        return self.register(Metric(name, metric.inputs, metric.kind, metric.units, f'alias of {target}',
+                                    weights = metric.weights, formula = metric.formula))
+
+    #anything else: formula receives one array per input, in order
+    def formula(self, name, inputs, formula, units, description = ''):
+        return self.register(Metric(name, inputs, 'formula', units, description, formula = formula))
+
+    #the requested metrics and everything they depend on, grouped into levels that only read earlier levels
+    def levels(self, names):
+
+        depth = {}
+        visiting = set()
+
+        def visit(name):
+            if name not in self.metrics:
+                return 0
+            if name in depth:
+                return depth[name]
+            if name in visiting:
+                raise ValueError(f'Metric {name!r} depends on itself')
+            visiting.add(name)
+            depth[name] = 1 + max((visit(operand) for operand in self.metrics[name].inputs), default = 0)
+            visiting.discard(name)
+            return depth[name]
+
+        for name in names:
+            if name not in self.metrics:
+                raise KeyError(f'Unknown metric {name!r}')
+            visit(name)
+
+        grouped = [[] for _ in range(max(depth.values(), default = 0))]
+        for name, level in depth.items():
+            grouped[level - 1].append(self.metrics[name])
+        return grouped
+
+    #SEDS series (anything not registered) read by the requested metrics
+    def required_inputs(self, names):
+        return sorted({operand for level in self.levels(names) for metric in level
+                       for operand in metric.inputs if operand not in self.metrics})
+
+    #evaluating only the requested metrics over a (rows, columns) array of SEDS series
+    def evaluate(self, values, columns, names):
+
+        names = list(names)
+        levels = self.levels(names)
+        column_positions = {column: i for i, column in enumerate(columns)}
+
+        missing = {}
+        for level in levels:
+            for metric in level:
+                absent = [operand for operand in metric.inputs
+                          if operand not in self.metrics and operand not in column_positions]
+                if absent:
+                    missing[metric.name] = absent
+        if missing:
+            raise MissingInputError(missing)
+
+        inputs = self.required_inputs(names)
+        data = values[:, [column_positions[column] for column in inputs]]
+        positions = {column: i for i, column in enumerate(inputs)}
+
+        for level in levels:
+            blocks = []
+            computed = []
+
+            linear = [metric for metric in level if metric.kind == 'linear']
+            if linear:
+                operands = sorted({operand for metric in linear for operand in metric.inputs})
+                operand_positions = {operand: i for i, operand in enumerate(operands)}
+                weights = np.zeros((len(operands), len(linear)))
+                for j, metric in enumerate(linear):
+                    for operand, weight in zip(metric.inputs, metric.weights):
+                        weights[operand_positions[operand], j] = weight
+
+                x = data[:, [positions[operand] for operand in operands]]
+
+                #NaN * 0 is NaN, so missing values are zeroed for the product and propagated through a mask
+                nan_mask = np.isnan(x)
+                block = np.where(nan_mask, 0, x) @ weights
+                block[nan_mask @ (weights != 0)] = np.nan
+                blocks.append(block)
+                computed += linear
+
+            ratio = [metric for metric in level if metric.kind == 'ratio']
+            if ratio:
+                with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                    blocks.append(
+                        data[:, [positions[metric.inputs[0]] for metric in ratio]] /
+                        data[:, [positions[metric.inputs[1]] for metric in ratio]]
+                    )
+                computed += ratio
+
+            for metric in level:
+                if metric.kind == 'formula':
+                    result = metric.formula(*[data[:, positions[operand]] for operand in metric.inputs])
+                    blocks.append(np.asarray(result, dtype = np.float64).reshape(-1, 1))
+                    computed.append(metric)
+
+            for offset, metric in enumerate(computed):
+                positions[metric.name] = data.shape[1] + offset
+            data = np.concatenate([data] + blocks, axis = 1)
+
+        #one contiguous block in the requested column order
+        return np.ascontiguousarray(data[:, [positions[name] for name in names]])
+
+#the SEDS power sector metrics used by the scripts and charts
+DEFAULT_REGISTRY = MetricRegistry()
+
+_r = DEFAULT_REGISTRY
+_r.linear('total_pop', {'TPOPP': 1000}, 'persons', 'approximate total population for per capita calculations')
+_r.linear('fossilfueltotal', {'CLEIB': 1, 'DFEIB': 1, 'NGEIB': 1}, 'billion Btu',
+          'coal, distillate and natural gas consumed by the electric power sector')
+_r.linear('fossil_GWh_total', {'fossilfueltotal': GWH_PER_BILLION_BTU}, 'GWh', 'electricity from fossil fuel sources')
+_r.ratio('fossil_GWh_percap', 'fossil_GWh_total', 'total_pop', 'GWh per person')
+
+_r.linear('coal_emiss', {'CLEIB': CO2_COAL}, 'metric tons CO2', 'CO2 equivalent of coal burned in power plants')
+_r.linear('diesel_emiss', {'DFEIB': CO2_DIESEL}, 'metric tons CO2', 'CO2 equivalent of diesel burned in power plants')
+_r.linear('natgas_emiss', {'NGEIB': CO2_NATGAS}, 'metric tons CO2', 'CO2 equivalent of natural gas burned in power plants')
+_r.linear('total_emissions', {'coal_emiss': 1, 'diesel_emiss': 1, 'natgas_emiss': 1}, 'metric tons CO2',
+          'CO2 equivalent from all fossil fuel burned in power plants')
+
+_r.ratio('coal_emiss_percap', 'CLEIB', 'total_pop', 'billion Btu per person')
+_r.ratio('diesel_emiss_percap', 'DFEIB', 'total_pop', 'billion Btu per person')
+_r.ratio('natgas_emiss_percap', 'NGEIB', 'total_pop', 'billion Btu per person')
+_r.ratio('total_emiss_percap', 'fossilfueltotal', 'total_pop', 'billion Btu per person')
+
+#electricity by source, from the electric power sector consumption series in billion Btu
+SOURCE_SERIES = {
+    'coal': 'CLEIB',
+    'diesel': 'DFEIB',
+    'natgas': 'NGEIB',
+    'solar': 'SOEGB',
+    'nuclear': 'NUETB',
+    'hydro': 'HYTCB',
+    'geo': 'GEEGB',
+    'wind': 'WYEGB',
+}
+
+#the SOURCE_SERIES sources counted as renewable
+RENEWABLE_SOURCES = ['solar', 'hydro', 'geo', 'wind']
+
+for _source, _msn in SOURCE_SERIES.items():
+    _r.linear(f'{_source}_GWh_total', {_msn: GWH_PER_BILLION_BTU}, 'GWh', f'electricity from {_source}')
+_r.linear('total_GWh_total', {f'{source}_GWh_total': 1 for source in SOURCE_SERIES}, 'GWh',
+          'electricity from all listed sources')
+
+for _source in list(SOURCE_SERIES) + ['total']:
+    _r.ratio(f'{_source}_GWh_percap', f'{_source}_GWh_total', 'total_pop', 'GWh per person')
+
+#shares of the listed generation, for tracking decarbonization trajectories
+_r.linear('renewable_GWh_total', {f'{source}_GWh_total': 1 for source in RENEWABLE_SOURCES}, 'GWh',
+          'electricity from solar, hydro, geothermal and wind')
+_r.ratio('fossil_share', 'fossil_GWh_total', 'total_GWh_total', 'fraction of listed generation')
+_r.ratio('renewable_share', 'renewable_GWh_total', 'total_GWh_total', 'fraction of listed generation')
+
+#the names the electricity columns had while they were (wrongly) labelled mWh, so older scripts and
+#csv readers still resolve them
+for _name in [name for name in DEFAULT_REGISTRY if '_GWh_' in name]:
+    _r.alias(_name.replace('_GWh_', '_mWh_'), _name)
+
+del _r, _source, _msn, _name
@@ -0,0 +1,307 @@
+import atexit
+import functools
+import inspect
+import json
+import logging
+import os
+import resource
+import threading
+import time
+
+logger = logging.getLogger('decarbonizeSoutheast.trace')
+
+#the active tracer; None means instrumentation is off and stages cost one global lookup
+_tracer = None
+_exit_hook_registered = False
+
+#stages open on each thread, innermost last, so code running inside one can report what it wrote
+_open_stages = threading.local()
+
+def _status_kb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+#Linux lets a process reset its RSS high-water mark, which gives a true per-stage peak;
+#elsewhere the peak is the process-wide ru_maxrss
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    peak = _status_kb('VmHWM')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if peak is None else peak
+
+def current_rss_kb():
+    current = _status_kb('VmRSS')
+    return peak_rss_kb() if current is None else current
+
+#rows of a frame, array or anything else with a shape
+def _rows(obj):
+    shape = getattr(obj, 'shape', None)
+    return int(shape[0]) if shape else None
+
+def _size(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+#shared stand-in returned by stage() while tracing is off
+class _NullStage:
+
+    rows_in = rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add_output(self, path):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+#one timed block: wall and CPU time, peak memory, rows in and out and bytes written
+class Stage:
+
+    def __init__(self, tracer, name, rows_in = None, **args):
+        self.tracer = tracer
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.args = args
+        self.outputs = []
+
+    def add_output(self, path):
+        if isinstance(path, (list, tuple, set)):
+            self.outputs.extend(path)
+        elif path:
+            self.outputs.append(path)
+
+    def __enter__(self):
+        #the high-water mark is process-wide, so it is only reset when no other stage is open;
+        #nested stages report the peak since their outermost stage started
+        self.top_level = self.tracer._open(self)
+        _stack().append(self)
+        self.peak_is_per_stage = self.top_level and reset_peak_rss()
+        self.rss_before = current_rss_kb()
+        self.profiler = self.tracer._start_profile(self)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        self.tracer._stop_profile(self)
+        _stack().remove(self)
+
+        record = {
+            'stage': self.name,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'peak_rss_mb': round(peak_rss_kb() / 1024, 1),
+            'rss_before_mb': round(self.rss_before / 1024, 1),
+            'rss_after_mb': round(current_rss_kb() / 1024, 1),
+            'peak_is_per_stage': self.peak_is_per_stage,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'bytes_written': sum(_size(path) for path in self.outputs),
+            **self.args,
+        }
+        if exc_type is not None:
+            record['error'] = f'{exc_type.__name__}: {exc}'
+
+        self.tracer._close(self, record, self.start_wall, wall)
+        return False
+
+#collects stage records and writes them as JSON lines and/or a Chrome trace-event file
+class Tracer:
+
+    def __init__(self, trace_path = None, log_path = None, profile = None, profile_dir = 'profiles',
+                 profile_stages = None):
+
+        if profile not in (None, 'cprofile', 'pyinstrument'):
+            raise ValueError(f"Unknown profiler {profile!r}, expected 'cprofile' or 'pyinstrument'")
+        if profile == 'pyinstrument':
+            import pyinstrument  # noqa: F401  fail at enable time rather than mid-run
+
+        self.trace_path = trace_path
+        self.log_path = log_path
+        self.profile = profile
+        self.profile_dir = profile_dir
+        self.profile_stages = None if profile_stages is None else set(profile_stages)
+
+        self.records = []
+        self.events = []
+        self._lock = threading.Lock()
+        self._open_stages = 0
+        self._profiling = None
+        self._profile_counts = {}
+        self._origin = time.perf_counter()
+        self._log_file = open(log_path, 'a') if log_path else None
+
+    def _open(self, stage):
+        with self._lock:
+            self._open_stages += 1
+            return self._open_stages == 1
+
+    def _close(self, stage, record, start, wall):
+        line = json.dumps(record, default = str)
+        with self._lock:
+            self._open_stages -= 1
+            self.records.append(record)
+            if self.trace_path:
+                pid, tid = os.getpid(), threading.get_ident()
+                ts = (start - self._origin) * 1e6
+                self.events.append({'name': stage.name, 'cat': 'stage', 'ph': 'X', 'ts': ts,
+                                    'dur': wall * 1e6, 'pid': pid, 'tid': tid, 'args': record})
+                self.events.append({'name': 'rss_mb', 'ph': 'C', 'ts': ts + wall * 1e6, 'pid': pid,
+                                    'args': {'rss': record['rss_after_mb'], 'peak': record['peak_rss_mb']}})
+            if self._log_file is not None:
+                self._log_file.write(line + '\n')
+                self._log_file.flush()
+        logger.info(line)
+
+    #only one profiler runs at a time: the outermost selected stage owns it
+    def _start_profile(self, stage):
+
+        if self.profile is None or self._profiling is not None:
+            return None
+        if self.profile_stages is None and not stage.top_level:
+            return None
+        if self.profile_stages is not None and stage.name not in self.profile_stages:
+            return None
+
+        if self.profile == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+
+        self._profiling = stage
+        return profiler
+
+    def _stop_profile(self, stage):
+
+        if self._profiling is not stage:
+            return
+
+        self._profiling = None
+        count = self._profile_counts[stage.name] = self._profile_counts.get(stage.name, 0) + 1
+        os.makedirs(self.profile_dir, exist_ok = True)
+        base = os.path.join(self.profile_dir, f"{stage.name.replace('/', '_')}-{count}")
+
+        if self.profile == 'cprofile':
+            stage.profiler.disable()
+            stage.profiler.dump_stats(base + '.prof')
+        else:
+            stage.profiler.stop()
+            with open(base + '.html', 'w') as f:
+                f.write(stage.profiler.output_html())
+
+    def close(self):
+        with self._lock:
+            if self.trace_path:
+                with open(self.trace_path, 'w') as f:
+                    json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+            if self._log_file is not None:
+                self._log_file.close()
+                self._log_file = None
+
+#turning tracing on for the rest of the process; the trace file is written by disable() or at exit
+def enable(trace_path = None, log_path = None, profile = None, profile_dir = 'profiles', profile_stages = None):
+    global _tracer, _exit_hook_registered
+    disable()
+    _tracer = Tracer(trace_path, log_path, profile, profile_dir, profile_stages)
+    if not _exit_hook_registered:
+        atexit.register(disable)
+        _exit_hook_registered = True
+    return _tracer
+
+def disable():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.close()
+    return tracer
+
+def enabled():
+    return _tracer is not None
+
+#SEDS_TRACE (Chrome trace file), SEDS_TRACE_LOG (JSON lines), SEDS_PROFILE (cprofile or pyinstrument),
+#SEDS_PROFILE_DIR and SEDS_PROFILE_STAGES (comma separated) switch tracing on without code changes
+def enable_from_env(environ = os.environ):
+
+    trace_path = environ.get('SEDS_TRACE')
+    log_path = environ.get('SEDS_TRACE_LOG')
+    profile = environ.get('SEDS_PROFILE')
+
+    if not (trace_path or log_path or profile):
+        return None
+
+    stages = environ.get('SEDS_PROFILE_STAGES')
+    return enable(
+        trace_path = trace_path,
+        log_path = log_path,
+        profile = profile,
+        profile_dir = environ.get('SEDS_PROFILE_DIR', 'profiles'),
+        profile_stages = stages.split(',') if stages else None,
+    )
+
+#a traced block: with stage('to_file', rows_in = len(gdf)) as s: ...; s.add_output(path)
+def stage(name, rows_in = None, **args):
+    if _tracer is None:
+        return _NULL_STAGE
+    return Stage(_tracer, name, rows_in, **args)
+
+def _stack():
+    if not hasattr(_open_stages, 'stack'):
+        _open_stages.stack = []
+    return _open_stages.stack
+
+#crediting a file written by the running code to the innermost stage open on this thread, for
+#functions that only sometimes write, like a cache that may serve its existing copy
+def add_output(path):
+    if _tracer is not None and _stack():
+        _stack()[-1].add_output(path)
+
+#tracing every call of a function; rows in come from the first argument with a shape, rows out
+#from the result, and output(result, arguments) may name the files or directories it wrote
+def traced(name = None, output = None):
+
+    def decorate(func):
+        stage_name = name or func.__qualname__
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+
+            rows_in = next((rows for rows in map(_rows, list(args) + list(kwargs.values())) if rows is not None), None)
+            with Stage(_tracer, stage_name, rows_in) as s:
+                result = func(*args, **kwargs)
+                s.rows_out = _rows(result)
+                if output is not None:
+                    bound = signature.bind(*args, **kwargs)
+                    bound.apply_defaults()
+                    s.add_output(output(result, bound.arguments))
+            return result
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,109 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from energyCube import SedsCube
+from energyMetrics import DEFAULT_METRICS, cube_metrics
+from energyQuery import REGIONS, EnergyQuery
+from metricRegistry import DEFAULT_REGISTRY
+
+#census bureau divisions, as a ready-made state -> region mapping
+CENSUS_DIVISIONS = {
+    **dict.fromkeys(['CT', 'ME', 'MA', 'NH', 'RI', 'VT'], 'New England'),
+    **dict.fromkeys(['NJ', 'NY', 'PA'], 'Middle Atlantic'),
+    **dict.fromkeys(['IL', 'IN', 'MI', 'OH', 'WI'], 'East North Central'),
+    **dict.fromkeys(['IA', 'KS', 'MN', 'MO', 'NE', 'ND', 'SD'], 'West North Central'),
+    **dict.fromkeys(['DE', 'DC', 'FL', 'GA', 'MD', 'NC', 'SC', 'VA', 'WV'], 'South Atlantic'),
+    **dict.fromkeys(['AL', 'KY', 'MS', 'TN'], 'East South Central'),
+    **dict.fromkeys(['AR', 'LA', 'OK', 'TX'], 'West South Central'),
+    **dict.fromkeys(['AZ', 'CO', 'ID', 'MT', 'NV', 'NM', 'UT', 'WY'], 'Mountain'),
+    **dict.fromkeys(['AK', 'CA', 'HI', 'OR', 'WA'], 'Pacific'),
+}
+
+#accepting either state -> region or region -> [states] and returning state -> region
+def state_region_mapping(mapping):
+    if mapping and all(isinstance(states, (list, tuple, set)) for states in mapping.values()):
+        return {state: region for region, states in mapping.items() for state in states}
+    return dict(mapping)
+
+#the named groupings from energyQuery.REGIONS as a state -> region mapping
+def named_regions(*names):
+    return state_region_mapping({name: REGIONS[name] for name in names})
+
+#region totals and per-capita metrics for every year, aggregated by EnergyQuery so a region has one
+#value however it is asked for: a state adds to a total only in the years its own value is defined,
+#and ratios are region totals over region population (summed over the states that report both)
+#rather than averages of state ratios
+def regional_metrics(data, mapping, metrics = None, registry = DEFAULT_REGISTRY):
+
+    cube = data if isinstance(data, SedsCube) else SedsCube.from_long(
+        data, state_column = 'StateCode' if 'StateCode' in data.columns else 'STUSPS'
+    )
+    metrics = DEFAULT_METRICS if metrics is None else list(metrics)
+    mapping = state_region_mapping(mapping)
+
+    #the state table holds the metrics plus the operands their regional ratios are recomputed from
+    operands = list(dict.fromkeys(operand for metric in metrics if registry[metric].kind == 'ratio'
+                                  for operand in registry[metric].inputs))
+    derived = list(dict.fromkeys(metrics + [operand for operand in operands if operand in registry]))
+    state_table = cube_metrics(cube, derived, registry)
+
+    msn_positions = {msn: i for i, msn in enumerate(cube.msns)}
+    series = [operand for operand in operands if operand not in registry and operand in msn_positions]
+    if series:
+        values = cube.values[:, :, [msn_positions[msn] for msn in series]]
+        state_table = state_table.join(pd.DataFrame(
+            values.reshape(len(cube.states) * len(cube.years), len(series)),
+            index = pd.MultiIndex.from_product([cube.states, cube.years]), columns = series
+        ).reindex(state_table.index))
+
+    present = set(cube.states)
+    regions = {}
+    for state, region in mapping.items():
+        if state in present:
+            regions.setdefault(region, []).append(state)
+    query = EnergyQuery(state_table, regions = regions, registry = registry)
+
+    years = pd.Index(cube.years)
+    return pd.concat(
+        [query.aggregate(region, metrics).reindex(years) for region in sorted(regions)],
+        keys = pd.Index(sorted(regions), name = 'Region')
+    )
+
+#dissolving the state polygons into one geometry per region, cached in memory and on disk; like
+#StateGeometry.get every call gets its own copy of the cached frame
+_dissolved = {}
+
+def regional_geometries(state_geometry, mapping, level = 'map', key = 'STUSPS'):
+
+    import geopandas as gpd
+    import shapely
+
+    mapping = state_region_mapping(mapping)
+    mapping_key = hashlib.blake2b(json.dumps(sorted(mapping.items())).encode('utf-8'), digest_size = 8).hexdigest()
+    cache_key = (state_geometry.source_key, mapping_key, level)
+
+    if cache_key in _dissolved:
+        return _dissolved[cache_key].copy()
+
+    path = os.path.join(state_geometry.cache_dir, f'regions_{state_geometry.source_key}_{mapping_key}_{level}.parquet')
+
+    if os.path.exists(path):
+        regions_gdf = gpd.read_parquet(path)
+    else:
+        states = state_geometry.get(level)
+        states = states[states[key].isin(list(mapping))]
+        region_of = states[key].map(mapping)
+
+        names = sorted(region_of.unique())
+        geometries = [shapely.union_all(states.geometry.values[(region_of == name).to_numpy()]) for name in names]
+
+        regions_gdf = gpd.GeoDataFrame({'Region': names}, geometry = geometries, crs = states.crs)
+        os.makedirs(state_geometry.cache_dir, exist_ok = True)
+        regions_gdf.to_parquet(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    _dissolved[cache_key] = regions_gdf
+    return regions_gdf.copy()
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+
+from concurrentFetcher import ConcurrentFetcher, FetchJob
+from pipelineTrace import add_output, traced
+from sedsLoader import SEDS_URL, iter_seds_chunks
+
+#location of the census state boundaries used by the scripts
+STATES_URL = 'https://www2.census.gov/geo/tiger/TIGER_RD18/LAYER/STATE/tl_rd22_us_state.zip'
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SEDS_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'decarbonizeSoutheast')
+)
+
+#seconds a revalidated download is trusted before the server is asked again
+DEFAULT_MAX_AGE = int(os.environ.get('SEDS_CACHE_MAX_AGE', 3600))
+
+#on-disk cache of raw downloads and their parsed binary forms, keyed by url; new payloads are
+#streamed by a ConcurrentFetcher, so a dropped connection resumes from the partial file
+class DownloadCache:
+
+    def __init__(self, cache_dir = DEFAULT_CACHE_DIR, max_bytes = None, max_entries = None, timeout = 60,
+                 max_age = DEFAULT_MAX_AGE, fetcher = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.max_age = max_age
+        self.fetcher = fetcher or ConcurrentFetcher(timeout = timeout)
+        self._fetched = {}
+        os.makedirs(cache_dir, exist_ok = True)
+
+    def _key(self, url):
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+
+    def _path(self, url, suffix):
+        return os.path.join(self.cache_dir, f'{self._key(url)}.{suffix}')
+
+    #payloads keep the extension from the url so readers like GDAL can recognise zip archives
+    def _payload_path(self, url):
+        extension = os.path.splitext(urlparse(url).path)[1]
+        return self._path(url, f'payload{extension}')
+
+    def _read_meta(self, url):
+        try:
+            with open(self._path(url, 'json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, url, meta):
+        meta['last_used'] = time.time()
+        self._atomic_write(self._path(url, 'json'), json.dumps(meta).encode('utf-8'))
+
+    def _atomic_write(self, path, payload):
+        fd, tmp_path = tempfile.mkstemp(dir = self.cache_dir, suffix = '.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    #returning the local path of the payload for url, revalidating it against the server first unless
+    #it was checked less than max_age seconds ago or already fetched through this cache (one cache is
+    #shared by every step of a run, so even with max_age 0 the server is asked once per run)
+    @traced('download')
+    def fetch(self, url):
+        if url not in self._fetched or not os.path.exists(self._fetched[url]):
+            self._fetched[url] = self._fetch(url)
+        return self._fetched[url]
+
+    def _fetch(self, url):
+
+        meta = self._read_meta(url)
+        payload_path = self._payload_path(url)
+        cached = meta is not None and os.path.exists(payload_path)
+
+        if cached and self.max_age and time.time() - meta.get('validated_at', 0) < self.max_age:
+            self._write_meta(url, meta)
+            return payload_path
+
+        #a cached copy is revalidated with a conditional request; when the server has a newer version
+        #the body is left unread and downloaded by the fetcher below
+        if cached:
+            headers = {}
+            if meta.get('etag'):
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified'):
+                headers['If-Modified-Since'] = meta['last_modified']
+
+            try:
+                response = requests.get(url, headers = headers, stream = True, timeout = self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                #offline: fall back to whatever copy we already have
+                self._write_meta(url, meta)
+                return payload_path
+
+            with response:
+                if response.status_code == 304:
+                    meta['validated_at'] = time.time()
+                    self._write_meta(url, meta)
+                    return payload_path
+
+                #a failing server is treated like being offline when there is a copy to use
+                if response.status_code >= 500:
+                    self._write_meta(url, meta)
+                    return payload_path
+
+                response.raise_for_status()
+
+        #the fetcher streams to a partial file and resumes it after a dropped connection, in this run
+        #or the next one, as long as the server still has the same version
+        try:
+            fetched = self.fetcher.fetch(FetchJob(url, payload_path))
+        except (requests.ConnectionError, requests.Timeout):
+            if cached:
+                self._write_meta(url, meta)
+                return payload_path
+            raise
+        add_output(payload_path)
+
+        #a new payload makes every parsed form stale
+        for parsed_name in (meta or {}).get('parsed', {}):
+            self._remove(self._path(url, parsed_name))
+
+        self._write_meta(url, {
+            'url': url,
+            'payload': os.path.basename(payload_path),
+            'etag': fetched.etag,
+            'last_modified': fetched.last_modified,
+            'fetched_at': time.time(),
+            'validated_at': time.time(),
+            'parsed': {},
+        })
+        self.evict()
+
+        return payload_path
+
+    #fetching several urls at once, as many in flight as the fetcher allows, paths in url order
+    def fetch_all(self, urls):
+        with ThreadPoolExecutor(max_workers = self.fetcher.max_workers) as ex:
+            return list(ex.map(self.fetch, urls))
+
+    #returning the path of the parsed form of url, building it from the payload only when missing or stale
+    @traced('parse')
+    def parsed(self, url, name, build, save):
+
+        payload_path = self.fetch(url)
+        meta = self._read_meta(url)
+        parsed_path = self._path(url, name)
+
+        if name in meta['parsed'] and os.path.exists(parsed_path):
+            return parsed_path
+
+        tmp_path = parsed_path + '.tmp'
+        save(build(payload_path), tmp_path)
+        self._remove(parsed_path)
+        os.replace(tmp_path, parsed_path)
+        add_output(parsed_path)
+
+        #builders may read other parsed forms of the same url, so the metadata is read again
+        meta = self._read_meta(url)
+        meta['parsed'][name] = self._size(parsed_path)
+        self._write_meta(url, meta)
+        self.evict()
+
+        return parsed_path
+
+    #parsed forms are single files or, like the memory-mapped cube store, directories
+    def _remove(self, path):
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors = True)
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _size(self, path):
+        if os.path.isdir(path):
+            return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _entries(self):
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            #the fetcher's resume state for a partial payload is not a cache entry
+            if not filename.endswith('.json') or filename.endswith('.part.json'):
+                continue
+            key = filename[:-len('.json')]
+            try:
+                with open(os.path.join(self.cache_dir, filename)) as f:
+                    meta = json.load(f)
+            except (OSError, ValueError):
+                continue
+            files = [os.path.join(self.cache_dir, f'{key}.{suffix}')
+                     for suffix in ['json'] + list(meta.get('parsed', {}))]
+            if meta.get('payload'):
+                files.append(os.path.join(self.cache_dir, meta['payload']))
+            size = sum(self._size(path) for path in files)
+            entries.append((meta.get('last_used', 0), size, files))
+        return entries
+
+    #dropping least recently used urls until the cache fits the configured limits
+    def evict(self):
+
+        if self.max_bytes is None and self.max_entries is None:
+            return
+
+        entries = sorted(self._entries(), key = lambda entry: entry[0])
+        total = sum(size for _, size, _ in entries)
+
+        #the most recently used entry is always kept so the current run can use it
+        while len(entries) > 1 and (
+            (self.max_bytes is not None and total > self.max_bytes) or
+            (self.max_entries is not None and len(entries) > self.max_entries)
+        ):
+            _, size, files = entries.pop(0)
+            for path in files:
+                self._remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, files in self._entries():
+            for path in files:
+                self._remove(path)
+        self._fetched.clear()
+
+#turning the loader filters into parquet predicates so warm reads only touch matching row groups
+def _parquet_filters(state_codes, msn_codes, years, exclude_states):
+
+    filters = []
+    if state_codes is not None:
+        filters.append(('StateCode', 'in', list(state_codes)))
+    if exclude_states is not None:
+        filters.append(('StateCode', 'not in', list(exclude_states)))
+    if msn_codes is not None:
+        filters.append(('MSN', 'in', list(msn_codes)))
+    if years is not None:
+        filters.append(('Year', 'in', [int(year) for year in years]))
+    return filters or None
+
+#converting the downloaded csv to Parquet one streamed chunk at a time, so building the cache
+#holds no more of SEDS in memory than the chunked loader does
+def _write_seds_parquet(payload_path, path):
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    codes = pa.dictionary(pa.int32(), pa.string())
+    schema = pa.schema([('StateCode', codes), ('MSN', codes), ('Year', pa.int16()), ('Data', pa.float32())])
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in iter_seds_chunks(payload_path):
+            writer.write_table(pa.Table.from_pandas(chunk, schema = schema, preserve_index = False))
+
+#SEDS through the cache: the full dataset is streamed once into Parquet and filtered on read
+def load_seds_cached(url = SEDS_URL, cache = None, state_codes = None, msn_codes = None,
+                     years = None, exclude_states = None):
+
+    cache = cache or DownloadCache()
+    filters = _parquet_filters(state_codes, msn_codes, years, exclude_states)
+
+    path = cache.parsed(url, 'parquet', lambda payload_path: payload_path, _write_seds_parquet)
+    df = pd.read_parquet(path, filters = filters)
+    for column in ('StateCode', 'MSN'):
+        df[column] = df[column].cat.remove_unused_categories()
+
+    return df
+
+#census state boundaries through the cache, kept as GeoParquet after the first read
+def load_states_cached(url = STATES_URL, cache = None):
+
+    #geopandas is only imported by callers that need the boundaries
+    import geopandas as gpd
+
+    cache = cache or DownloadCache()
+
+    def build(path):
+        return gpd.read_file(f'zip://{path}')
+
+    def save(gdf, path):
+        gdf.to_parquet(path)
+
+    return gpd.read_parquet(cache.parsed(url, 'geoparquet', build, save))
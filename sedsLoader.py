@@ -0,0 +1,95 @@
+import contextlib
+
+import numpy as np
+import pandas as pd
+import requests
+from pandas.api.types import union_categoricals
+
+from pipelineTrace import traced
+
+#location of the complete SEDS dataset on the EIA website
+SEDS_URL = 'https://www.eia.gov/state/seds/CDF/Complete_SEDS.csv'
+
+#columns kept from the csv (Data_Status is never used downstream) and their compact dtypes
+SEDS_COLUMNS = ['StateCode', 'MSN', 'Year', 'Data']
+SEDS_DTYPES = {'StateCode': 'category', 'MSN': 'category', 'Year': 'int16', 'Data': 'float32'}
+
+#opening either a local path or an http(s) url as a binary stream that pandas can read in chunks
+@contextlib.contextmanager
+def open_seds_stream(source, timeout = 60):
+
+    if str(source).startswith(('http://', 'https://')):
+        with requests.get(source, stream = True, timeout = timeout) as response:
+            response.raise_for_status()
+            #let urllib3 undo any gzip transfer encoding while we read
+            response.raw.decode_content = True
+            yield response.raw
+    else:
+        with open(source, 'rb') as stream:
+            yield stream
+
+#building the boolean mask for one chunk from the requested filters
+def _chunk_mask(chunk, state_codes, exclude_states, msn_codes, years):
+
+    mask = np.ones(len(chunk), dtype = bool)
+
+    if state_codes is not None:
+        mask &= chunk['StateCode'].isin(state_codes).to_numpy()
+    if exclude_states is not None:
+        mask &= ~chunk['StateCode'].isin(exclude_states).to_numpy()
+    if msn_codes is not None:
+        mask &= chunk['MSN'].isin(msn_codes).to_numpy()
+    if years is not None:
+        mask &= chunk['Year'].isin(years).to_numpy()
+
+    return mask
+
+#the SEDS csv as a stream of filtered chunks, so callers never hold more than one unfiltered chunk
+def iter_seds_chunks(source = SEDS_URL, state_codes = None, msn_codes = None, years = None,
+                     exclude_states = None, chunksize = 250_000, data_dtype = 'float32', timeout = 60):
+
+    dtypes = dict(SEDS_DTYPES, Data = data_dtype)
+
+    #the filters are turned into lists once so isin does not rebuild them per chunk
+    state_codes = None if state_codes is None else list(state_codes)
+    exclude_states = None if exclude_states is None else list(exclude_states)
+    msn_codes = None if msn_codes is None else list(msn_codes)
+    years = None if years is None else [int(year) for year in years]
+
+    with open_seds_stream(source, timeout) as stream:
+        reader = pd.read_csv(stream, usecols = SEDS_COLUMNS, dtype = dtypes, chunksize = chunksize)
+
+        for chunk in reader:
+            chunk = chunk[_chunk_mask(chunk, state_codes, exclude_states, msn_codes, years)]
+            if not chunk.empty:
+                yield chunk
+
+#streaming the SEDS csv in chunks, keeping only the requested states, MSN codes and years
+@traced('load_seds')
+def load_seds(source = SEDS_URL, state_codes = None, msn_codes = None, years = None,
+              exclude_states = None, chunksize = 250_000, data_dtype = 'float32', timeout = 60):
+
+    pieces = {column: [] for column in SEDS_COLUMNS}
+
+    for chunk in iter_seds_chunks(source, state_codes, msn_codes, years, exclude_states,
+                                  chunksize, data_dtype, timeout):
+        for column in ('StateCode', 'MSN'):
+            pieces[column].append(chunk[column].cat.remove_unused_categories())
+        for column in ('Year', 'Data'):
+            pieces[column].append(chunk[column].to_numpy())
+
+    if not pieces['Data']:
+        return pd.DataFrame({
+            'StateCode': pd.Categorical([]),
+            'MSN': pd.Categorical([]),
+            'Year': np.array([], dtype = 'int16'),
+            'Data': np.array([], dtype = data_dtype),
+        })
+
+    #stitching the chunks back together without falling back to object dtype
+    return pd.DataFrame({
+        'StateCode': union_categoricals(pieces['StateCode']),
+        'MSN': union_categoricals(pieces['MSN']),
+        'Year': np.concatenate(pieces['Year']),
+        'Data': np.concatenate(pieces['Data']),
+    })
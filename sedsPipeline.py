@@ -0,0 +1,437 @@
+#the Post_1.py / Post_2.py pipeline as importable functions and a command line:
+#  python sedsPipeline.py [--cache-dir DIR] [--trace trace.json] {fetch,metrics,export,refresh,geopackage,tiles,maps,charts} ...
+#geopandas, matplotlib and plotly are imported inside the steps that use them, so a metrics-only
+#run never pays for them
+import argparse
+import os
+import sys
+
+from pipelineTrace import stage
+
+#states dropped from the continental analysis: Alaska, Hawaii and the two US aggregates
+CONTINENTAL_EXCLUDED_STATES = ['HI', 'AK', 'X3', 'X5']
+
+def _cache(cache = None):
+    from sedsCache import DownloadCache
+    if isinstance(cache, DownloadCache):
+        return cache
+    return DownloadCache() if cache is None else DownloadCache(cache)
+
+def _seds_url(url):
+    from sedsLoader import SEDS_URL
+    return url or SEDS_URL
+
+def _states_url(url):
+    from sedsCache import STATES_URL
+    return url or STATES_URL
+
+#the state boundaries at a stateGeometry precision level ('full', 'web', 'map', ... or meters)
+def _states(states_url, cache, level = 'full'):
+    from sedsCache import load_states_cached
+    from stateGeometry import StateGeometry
+    return StateGeometry(loader = lambda: load_states_cached(_states_url(states_url), cache)).get(level)
+
+#downloading (or revalidating) SEDS and the state boundaries side by side and building their parsed cache forms
+def fetch(cache = None, url = None, states_url = None, states = True, cube = False):
+
+    from sedsCache import load_seds_cached, load_states_cached
+
+    cache = _cache(cache)
+    cache.fetch_all([_seds_url(url)] + ([_states_url(states_url)] if states else []))
+    fetched = {'seds_rows': len(load_seds_cached(_seds_url(url), cache))}
+
+    if states:
+        fetched['states'] = len(load_states_cached(_states_url(states_url), cache))
+    if cube:
+        from cubeStore import load_cube_cached
+        fetched['cube_msns'] = len(load_cube_cached(_seds_url(url), cache).msns)
+
+    return fetched
+
+#the long SEDS rows for the continental states with StateCode renamed to match the shapefile
+def load_continental(cache = None, url = None, msn_codes = None, exclude_states = CONTINENTAL_EXCLUDED_STATES):
+
+    from sedsCache import load_seds_cached
+
+    df = load_seds_cached(_seds_url(url), _cache(cache), msn_codes = msn_codes, exclude_states = exclude_states)
+    return df.rename(columns = {'StateCode': 'STUSPS'})
+
+#(STUSPS, Year) metrics table, reading only the MSN codes the requested metrics need
+def continental_metrics(cache = None, url = None, metrics = None, exclude_states = CONTINENTAL_EXCLUDED_STATES):
+
+    from energyMetrics import metric_inputs
+    from sedsFunctions import calculate_energy_metrics
+
+    raw = load_continental(cache, url, msn_codes = metric_inputs(metrics), exclude_states = exclude_states)
+    return calculate_energy_metrics(raw, metrics)
+
+#writing a metrics table as csv or parquet, picked from the file extension
+def write_metrics(metrics_df, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+    parquet = path.endswith('.parquet')
+    with stage('to_parquet' if parquet else 'to_csv', rows_in = len(metrics_df)) as s:
+        if parquet:
+            metrics_df.to_parquet(path)
+        else:
+            metrics_df.to_csv(path)
+        s.add_output(path)
+    return path
+
+#an EnergyQuery over the given metrics table (or prebuilt query), computing the metrics when none is given
+def _query(metrics_df, cache, url):
+    from energyQuery import EnergyQuery
+    if isinstance(metrics_df, EnergyQuery):
+        return metrics_df
+    return EnergyQuery(continental_metrics(cache, url) if metrics_df is None else metrics_df)
+
+#per-state metric files for a list of states or a named region
+def export(output_dir, states = None, region = None, metrics_df = None, cache = None, url = None,
+           fmt = 'csv', partitioned = False, workers = None):
+
+    from sedsFunctions import export_state_energy_data
+
+    query = _query(metrics_df, cache, url)
+    if region is not None:
+        states = query.region_states(region)
+    elif states is None:
+        states = query.states
+
+    return export_state_energy_data(states, query, output_dir, fmt = fmt, partitioned = partitioned, workers = workers)
+
+#one SEDS year pivoted to STUSPS x MSN, optionally written as csv and as a shapefile joined to the states
+def year_snapshot(year, cache = None, url = None, states_url = None, csv_path = None, shapes_path = None):
+
+    from sedsCache import load_seds_cached
+
+    cache = _cache(cache)
+    seds_year = load_seds_cached(_seds_url(url), cache, years = [year])
+    with stage(f'pivot_{year}', rows_in = len(seds_year)) as s:
+        pivot = seds_year.pivot(index = 'StateCode', columns = 'MSN', values = 'Data')
+        s.rows_out = len(pivot)
+    pivot.index.name = 'STUSPS'
+
+    if csv_path is not None:
+        with stage('to_csv', rows_in = len(pivot)) as s:
+            pivot.to_csv(csv_path)
+            s.add_output(csv_path)
+    if shapes_path is not None:
+        from sedsCache import load_states_cached
+        states_gdf = load_states_cached(_states_url(states_url), cache)
+        with stage('join', rows_in = len(pivot)) as s:
+            snapshot_shapes = states_gdf.merge(pivot, on = 'STUSPS')
+            s.rows_out = len(snapshot_shapes)
+        with stage('to_file', rows_in = len(snapshot_shapes)) as s:
+            snapshot_shapes.to_file(shapes_path)
+            s.add_output(shapes_path)
+
+    return pivot
+
+#every year's SEDS columns joined to the state geometries in one GeoPackage
+def geopackage(gpk_path, cache = None, url = None, states_url = None, layer_prefix = 'SEDS_States',
+               msn_codes = None, exclude_states = None, level = 'full'):
+
+    from cubeStore import load_cube_cached
+    from geopackageWriter import write_yearly_geopackage
+
+    cache = _cache(cache)
+    cube = load_cube_cached(_seds_url(url), cache, msn_codes = msn_codes)
+    yearly_dfs = cube.yearly_frames()
+    if exclude_states is not None:
+        yearly_dfs = {year: df.drop(index = exclude_states, errors = 'ignore') for year, df in yearly_dfs.items()}
+
+    directory = os.path.dirname(gpk_path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+
+    write_yearly_geopackage(gpk_path, _states(states_url, cache, level), yearly_dfs, layer_prefix = layer_prefix)
+    return gpk_path
+
+#the yearly refresh: metrics recomputed only for (state, year) slices whose inputs changed, and only the
+#affected per-state csvs and GeoPackage years rewritten, tracked by a manifest in output_dir; the
+#result also carries the cube the metrics came from, so callers can reuse it instead of loading again
+def refresh(output_dir, cache = None, url = None, states_url = None, states = None, region = None,
+            gpk_path = None, layer_prefix = 'State_Energy_Shapes', metrics = None,
+            exclude_states = CONTINENTAL_EXCLUDED_STATES, level = 'full'):
+
+    from cubeStore import load_cube_cached
+    from energyMetrics import metric_inputs
+    from incrementalRefresh import geopackage_year_writer, incremental_refresh
+
+    cache = _cache(cache)
+    cube = load_cube_cached(_seds_url(url), cache, msn_codes = metric_inputs(metrics))
+    if exclude_states:
+        cube = cube.without_states(exclude_states)
+
+    if region is not None:
+        from energyQuery import REGIONS
+        states = REGIONS[region]
+
+    write_year_layers = None
+    if gpk_path is not None:
+        from sedsCache import load_states_cached
+        write_year_layers = geopackage_year_writer(
+            gpk_path, cube, lambda: load_states_cached(_states_url(states_url), cache), layer_prefix = layer_prefix,
+            level = level
+        )
+
+    result = incremental_refresh(cube, output_dir, state_codes = states, write_year_layers = write_year_layers,
+                                 metrics = metrics)
+    result['cube'] = cube
+    return result
+
+#MBTiles vector tiles of the state polygons with every year's SEDS columns as per-year attributes
+def tiles(mbtiles_path, cache = None, url = None, states_url = None, msn_codes = None, exclude_states = None,
+          min_zoom = 0, max_zoom = 6, workers = None, level = 'full'):
+
+    from cubeStore import load_cube_cached
+    from vectorTiles import write_vector_tiles
+
+    cache = _cache(cache)
+    cube = load_cube_cached(_seds_url(url), cache, msn_codes = msn_codes)
+    yearly_dfs = cube.yearly_frames()
+
+    states_gdf = _states(states_url, cache, level)
+    if exclude_states is not None:
+        states_gdf = states_gdf[~states_gdf['STUSPS'].isin(exclude_states)]
+
+    directory = os.path.dirname(mbtiles_path)
+    if directory:
+        os.makedirs(directory, exist_ok = True)
+
+    return write_vector_tiles(mbtiles_path, states_gdf, yearly_dfs, min_zoom = min_zoom, max_zoom = max_zoom,
+                              workers = workers)
+
+#a choropleth per year for one SEDS column (read straight from the cube store) or one derived metric
+def maps(path_pattern, column = None, metric = None, years = None, cache = None, url = None, states_url = None,
+         level = 'map', title = None, label = '', cmap = 'YlOrRd', xlim = (-130, -65), ylim = (24, 50),
+         workers = None, animation = None):
+
+    if (column is None) == (metric is None):
+        raise ValueError('Pass exactly one of column (a SEDS MSN code) or metric')
+
+    from mapRenderer import metric_series, render_map_series, yearly_series
+    from sedsCache import load_states_cached
+    from stateGeometry import StateGeometry
+
+    cache = _cache(cache)
+
+    if column is not None:
+        from cubeStore import load_cube_cached
+        values = yearly_series(load_cube_cached(_seds_url(url), cache, msn_codes = [column]).yearly_frames(), column)
+    else:
+        values = metric_series(continental_metrics(cache, url, metrics = [metric]), metric)
+
+    if years is not None:
+        wanted = set(years)
+        values = values.loc[:, [year for year in values.columns if year in wanted]]
+
+    geometry = StateGeometry(loader = lambda: load_states_cached(_states_url(states_url), cache))
+
+    return render_map_series(
+        geometry.get(level),
+        values,
+        path_pattern,
+        title = title or f'{column or metric} for {{year}}',
+        label = label,
+        cmap = cmap,
+        xlim = xlim,
+        ylim = ylim,
+        workers = workers,
+        animation = animation,
+    )
+
+#stacked bar charts for every state and metric group, as images and/or one HTML page
+def charts(output_dir, states = None, region = None, groups = None, years = None, metrics_df = None,
+           cache = None, url = None, html = None, workers = None, image_format = 'png'):
+
+    from chartFactory import METRIC_GROUPS, ChartJob, export_charts, export_html_bundle
+
+    query = _query(metrics_df, cache, url)
+    if region is not None:
+        states = query.region_states(region)
+    elif states is None:
+        states = query.states
+
+    groups = list(METRIC_GROUPS) if groups is None else list(groups)
+    if years is None:
+        years = sorted({int(year) for year in query.frame.index.get_level_values(1)})
+
+    jobs = [ChartJob(state, group, list(years), os.path.join(output_dir, f'{state}_{group}.{image_format}'))
+            for state in states for group in groups]
+
+    if html is not None:
+        return [export_html_bundle(jobs, query, html)]
+    return export_charts(jobs, query, workers = workers)
+
+#"1990-2000" or "2005" or "1990-2000,2010"
+def parse_years(text):
+    if text is None:
+        return None
+    years = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        years.extend(range(int(first), int(last or first) + 1))
+    return years
+
+def _split(text):
+    return None if text is None else [item for item in text.split(',') if item]
+
+def _add_state_options(parser):
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--states', type = _split, help = 'comma separated state codes')
+    group.add_argument('--region', help = 'a region from energyQuery.REGIONS, e.g. southeast')
+
+def _cmd_fetch(args):
+    fetched = fetch(args.cache_dir, args.url, args.states_url, states = not args.no_states, cube = args.cube)
+    for name, count in fetched.items():
+        print(f'{name}: {count}')
+
+def _cmd_metrics(args):
+    metrics_df = continental_metrics(args.cache_dir, args.url, metrics = args.metrics)
+    if args.region is not None or args.states is not None:
+        from energyQuery import EnergyQuery
+        metrics_df = EnergyQuery(metrics_df).select(states = args.states, region = args.region)
+    if args.output:
+        print(f'Exported: {write_metrics(metrics_df, args.output)}')
+    else:
+        print(metrics_df)
+
+def _cmd_export(args):
+    export(args.output_dir, states = args.states, region = args.region, cache = args.cache_dir, url = args.url,
+           fmt = args.format, partitioned = args.partitioned, workers = args.workers)
+
+def _cmd_geopackage(args):
+    exclude = CONTINENTAL_EXCLUDED_STATES if args.continental else None
+    geopackage(args.output, args.cache_dir, args.url, args.states_url, layer_prefix = args.layer_prefix,
+               msn_codes = args.msns, exclude_states = exclude, level = args.level)
+    print(f'Exported: {args.output}')
+
+def _cmd_refresh(args):
+    result = refresh(args.output_dir, args.cache_dir, args.url, args.states_url, states = args.states,
+                     region = args.region, gpk_path = args.geopackage, layer_prefix = args.layer_prefix,
+                     metrics = args.metrics, level = args.level)
+    print(f"{len(result['recomputed'])} (state, year) slices recomputed, {len(result['csv'])} csvs and "
+          f"{len(result['layers'])} yearly layers rewritten, {len(result['removed_csv'])} csvs and "
+          f"{len(result['removed_layers'])} layers removed")
+
+def _cmd_tiles(args):
+    exclude = CONTINENTAL_EXCLUDED_STATES if args.continental else None
+    tiles(args.output, args.cache_dir, args.url, args.states_url, msn_codes = args.msns, exclude_states = exclude,
+          min_zoom = args.min_zoom, max_zoom = args.max_zoom, workers = args.workers, level = args.level)
+    print(f'Exported: {args.output}')
+    if args.serve is not None:
+        from vectorTiles import serve_tiles
+        server = serve_tiles(args.output, port = args.serve)
+        print(f'Serving http://127.0.0.1:{server.server_port}/metadata.json (Ctrl+C to stop)')
+        try:
+            server.serve_thread.join()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+def _cmd_maps(args):
+    paths = maps(args.output, column = args.column, metric = args.metric, years = parse_years(args.years),
+                 cache = args.cache_dir, url = args.url, states_url = args.states_url, level = args.level,
+                 label = args.label, cmap = args.cmap, workers = args.workers, animation = args.animation)
+    print(f'{len(paths)} maps written')
+
+def _cmd_charts(args):
+    charts(args.output_dir, states = args.states, region = args.region, groups = args.groups,
+           years = parse_years(args.years), cache = args.cache_dir, url = args.url, html = args.html,
+           workers = args.workers)
+
+def build_parser():
+
+    parser = argparse.ArgumentParser(prog = 'sedsPipeline', description = 'SEDS energy and emissions pipeline')
+    parser.add_argument('--cache-dir', help = 'download cache (default $SEDS_CACHE_DIR or ~/.cache/decarbonizeSoutheast)')
+    parser.add_argument('--url', help = 'SEDS csv location (default the EIA Complete_SEDS.csv)')
+    parser.add_argument('--states-url', help = 'zipped state shapefile (default the census TIGER states)')
+    parser.add_argument('--trace', help = 'write a Chrome trace of the pipeline stages to this file')
+    parser.add_argument('--trace-log', help = 'append JSON lines stage records to this file')
+    parser.add_argument('--profile', choices = ['cprofile', 'pyinstrument'])
+    commands = parser.add_subparsers(dest = 'command', required = True)
+
+    p = commands.add_parser('fetch', help = 'download SEDS and the state boundaries into the cache')
+    p.add_argument('--no-states', action = 'store_true')
+    p.add_argument('--cube', action = 'store_true', help = 'also build the memory-mapped cube store')
+    p.set_defaults(func = _cmd_fetch)
+
+    p = commands.add_parser('metrics', help = 'compute the energy and emissions metrics')
+    p.add_argument('--output', help = '.csv or .parquet file (printed when omitted)')
+    p.add_argument('--metrics', type = _split, help = 'comma separated metric names (default all)')
+    _add_state_options(p)
+    p.set_defaults(func = _cmd_metrics)
+
+    p = commands.add_parser('export', help = 'write the metrics to one file per state')
+    p.add_argument('--output-dir', default = 'output')
+    p.add_argument('--format', choices = ['csv', 'csv.gz', 'parquet'], default = 'csv')
+    p.add_argument('--partitioned', action = 'store_true')
+    p.add_argument('--workers', type = int)
+    _add_state_options(p)
+    p.set_defaults(func = _cmd_export)
+
+    p = commands.add_parser('geopackage', help = 'write every SEDS year joined to the states as a GeoPackage')
+    p.add_argument('--output', required = True)
+    p.add_argument('--layer-prefix', default = 'SEDS_States')
+    p.add_argument('--msns', type = _split, help = 'comma separated MSN codes (default all)')
+    p.add_argument('--continental', action = 'store_true', help = 'drop AK, HI and the US aggregates')
+    p.add_argument('--level', default = 'full', help = 'geometry precision level, e.g. web for a smaller file')
+    p.set_defaults(func = _cmd_geopackage)
+
+    p = commands.add_parser('refresh', help = 'recompute and rewrite only what changed since the last refresh')
+    p.add_argument('--output-dir', default = 'output', help = 'per-state csvs, the metrics and the refresh manifest')
+    p.add_argument('--geopackage', help = 'also keep the yearly metric input layers in this GeoPackage up to date')
+    p.add_argument('--layer-prefix', default = 'State_Energy_Shapes')
+    p.add_argument('--metrics', type = _split, help = 'comma separated metric names (default all)')
+    p.add_argument('--level', default = 'full', help = 'geometry precision level of the GeoPackage')
+    _add_state_options(p)
+    p.set_defaults(func = _cmd_refresh)
+
+    p = commands.add_parser('tiles', help = 'write the states and every SEDS year as MBTiles vector tiles')
+    p.add_argument('--output', required = True, help = '.mbtiles file')
+    p.add_argument('--msns', type = _split, help = 'comma separated MSN codes (default all)')
+    p.add_argument('--continental', action = 'store_true', help = 'drop AK, HI and the US aggregates')
+    p.add_argument('--min-zoom', type = int, default = 0)
+    p.add_argument('--max-zoom', type = int, default = 6)
+    p.add_argument('--level', default = 'full', help = 'geometry precision level the zoom levels start from')
+    p.add_argument('--workers', type = int, help = 'processes rendering zoom levels in parallel')
+    p.add_argument('--serve', type = int, nargs = '?', const = 0, help = 'then serve the tiles locally on this port')
+    p.set_defaults(func = _cmd_tiles)
+
+    p = commands.add_parser('maps', help = 'render a choropleth per year')
+    source = p.add_mutually_exclusive_group(required = True)
+    source.add_argument('--column', help = 'a SEDS MSN code, e.g. NGEIB')
+    source.add_argument('--metric', help = 'a derived metric, e.g. total_emissions')
+    p.add_argument('--output', required = True, help = 'path pattern with {year}')
+    p.add_argument('--years', help = 'e.g. 1990-2022 or 2000,2010,2020')
+    p.add_argument('--level', default = 'map', help = 'geometry precision level')
+    p.add_argument('--label', default = '')
+    p.add_argument('--cmap', default = 'YlOrRd')
+    p.add_argument('--workers', type = int)
+    p.add_argument('--animation', help = 'also stitch the frames into this .gif or .mp4')
+    p.set_defaults(func = _cmd_maps)
+
+    p = commands.add_parser('charts', help = 'export stacked bar charts per state')
+    p.add_argument('--output-dir', default = 'figures')
+    p.add_argument('--groups', type = _split, help = 'comma separated chart groups (default all)')
+    p.add_argument('--years', help = 'e.g. 1990-2022 or 2000,2010,2020')
+    p.add_argument('--html', help = 'write one HTML page instead of image files')
+    p.add_argument('--workers', type = int)
+    _add_state_options(p)
+    p.set_defaults(func = _cmd_charts)
+
+    return parser
+
+def main(argv = None):
+
+    args = build_parser().parse_args(argv)
+
+    if args.trace or args.trace_log or args.profile:
+        import pipelineTrace
+        pipelineTrace.enable(trace_path = args.trace, log_path = args.trace_log, profile = args.profile)
+
+    args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import hashlib
+import os
+
+import geopandas as gpd
+import shapely
+
+from sedsCache import DEFAULT_CACHE_DIR, load_states_cached
+
+#Albers equal-area conic centred on the Southeast, in meters
+SOUTHEAST_ALBERS = '+proj=aea +lat_0=23 +lon_0=-84 +lat_1=27 +lat_2=35 +datum=NAD83 +units=m +no_defs'
+
+#NAD83 / Conus Albers, for maps of the whole continental US
+CONUS_ALBERS = 'EPSG:5070'
+
+#named precision levels: simplification tolerance in meters (0 keeps the TIGER vertices)
+PRECISION_LEVELS = {
+    'full': 0,
+    'web': 250,
+    'map': 1000,
+    'thumbnail': 5000,
+}
+
+#simplifying an array of polygons that tile the plane together, so neighbours keep sharing their
+#borders; shapely before 2.1 has no coverage simplification and each polygon is simplified alone
+def simplify_coverage(geometries, tolerance):
+    if hasattr(shapely, 'coverage_simplify'):
+        return shapely.coverage_simplify(geometries, tolerance)
+    return shapely.simplify(geometries, tolerance, preserve_topology = True)
+
+#simplifying the states as one coverage so neighbouring states keep sharing their borders
+def simplify_states(states_gdf, tolerance):
+
+    if not tolerance:
+        return states_gdf
+
+    projected = states_gdf.to_crs(SOUTHEAST_ALBERS)
+    simplified = simplify_coverage(projected.geometry.values, tolerance)
+
+    projected = projected.set_geometry(gpd.GeoSeries(simplified, index = projected.index, crs = projected.crs))
+    return projected.to_crs(states_gdf.crs)
+
+#state boundaries loaded once and cached in memory and on disk at several precisions and projections
+class StateGeometry:
+
+    def __init__(self, states_gdf = None, loader = load_states_cached,
+                 cache_dir = os.path.join(DEFAULT_CACHE_DIR, 'geometry')):
+        self._states = states_gdf
+        self._loader = loader
+        self._memory = {}
+        self._source_key = None
+        self.cache_dir = cache_dir
+
+    #the full-resolution boundaries, read on first use
+    @property
+    def states(self):
+        if self._states is None:
+            self._states = self._loader()
+        return self._states
+
+    #fingerprint of the source geometry so disk entries are dropped when TIGER changes
+    @property
+    def source_key(self):
+        if self._source_key is None:
+            h = hashlib.blake2b(digest_size = 12)
+            h.update(str(self.states.crs).encode('utf-8'))
+            for wkb in shapely.to_wkb(self.states.geometry.values):
+                h.update(wkb)
+            self._source_key = h.hexdigest()
+        return self._source_key
+
+    #states at a precision level (name or tolerance in meters), optionally reprojected; every call gets
+    #its own copy of the frame (the shapely geometries themselves are immutable and shared), so callers
+    #can add columns or reproject without changing what later callers see
+    def get(self, level = 'full', crs = None):
+        return self._get(level, crs).copy()
+
+    def _get(self, level, crs):
+
+        tolerance = PRECISION_LEVELS[level] if isinstance(level, str) else level
+        key = (tolerance, crs)
+
+        if key in self._memory:
+            return self._memory[key]
+
+        if not tolerance and crs is None:
+            self._memory[key] = self.states
+            return self.states
+
+        crs_tag = 'source' if crs is None else hashlib.blake2b(str(crs).encode('utf-8'), digest_size = 6).hexdigest()
+        path = os.path.join(self.cache_dir, f'states_{self.source_key}_{tolerance:g}_{crs_tag}.parquet')
+
+        if os.path.exists(path):
+            gdf = gpd.read_parquet(path)
+        else:
+            gdf = simplify_states(self.states, tolerance)
+            if crs is not None:
+                gdf = gdf.to_crs(crs)
+            os.makedirs(self.cache_dir, exist_ok = True)
+            gdf.to_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+
+        self._memory[key] = gdf
+        return gdf
@@ -0,0 +1,208 @@
+import numpy as np
+import pandas as pd
+
+from energyMetrics import DEFAULT_METRICS
+
+#metrics worth following over time, on top of the DEFAULT_METRICS columns
+TRAJECTORY_METRICS = DEFAULT_METRICS + ['fossil_share', 'renewable_share', 'renewable_GWh_total',
+                                        'total_emiss_percap']
+
+#rolling means, year-over-year changes, CAGR, fitted trends and crossover years for every state and
+#metric at once, on a dense (state, year, metric) array built from the (STUSPS, Year) metrics table;
+#the metrics followed are the TRAJECTORY_METRICS columns the table has unless others are named
+class TrendEngine:
+
+    def __init__(self, metrics_df, metrics = None):
+
+        if metrics is None:
+            metrics = [metric for metric in TRAJECTORY_METRICS if metric in metrics_df.columns]
+            if not metrics:
+                raise ValueError('The table has none of the TRAJECTORY_METRICS columns; name the metrics to follow')
+        metrics_df = metrics_df[list(metrics)]
+
+        state_codes, states = pd.factorize(metrics_df.index.get_level_values(0), sort = True)
+        row_years = np.asarray(metrics_df.index.get_level_values(1), dtype = np.int64)
+
+        #one slot per calendar year so deltas and windows are in years even where rows are missing
+        self.years = np.arange(row_years.min(), row_years.max() + 1)
+        self.states = pd.Index(states, name = metrics_df.index.names[0])
+        self.metrics = list(metrics_df.columns)
+        self._metric_positions = {metric: i for i, metric in enumerate(self.metrics)}
+
+        self.values = np.full((len(states), len(self.years), len(self.metrics)), np.nan)
+        self.values[state_codes, row_years - self.years[0]] = metrics_df.to_numpy(dtype = np.float64)
+
+    #the (state, year, metric) block for the metrics and inclusive year range asked for
+    def _block(self, metrics = None, start = None, end = None):
+        metrics = self.metrics if metrics is None else [metrics] if isinstance(metrics, str) else list(metrics)
+        first = 0 if start is None else max(int(start) - self.years[0], 0)
+        last = len(self.years) if end is None else max(int(end) - self.years[0] + 1, 0)
+        x = self.values[:, first:last][:, :, [self._metric_positions[metric] for metric in metrics]]
+        years = self.years[first:last]
+
+        #a range outside the data becomes a single empty year, so every result is simply all NaN
+        if not len(years):
+            x = np.full((len(self.states), 1, len(metrics)), np.nan)
+            years = np.array([self.years[0] if start is None else int(start)])
+        return x, years, metrics
+
+    #(STUSPS, Year) frame from a (state, year, metric) block, without the (state, year) rows that are all NaN
+    def _frame(self, x, years, metrics):
+        index = pd.MultiIndex.from_product([self.states, pd.Index(years, name = 'Year')])
+        flat = x.reshape(-1, len(metrics))
+        present = ~np.isnan(flat).all(axis = 1)
+        return pd.DataFrame(flat[present], index = index[present], columns = metrics)
+
+    #trailing mean over window years, ignoring missing years, once min_periods values are in the window
+    def rolling_mean(self, window = 5, metrics = None, min_periods = 1):
+
+        x, years, metrics = self._block(metrics)
+        valid = ~np.isnan(x)
+
+        pad = np.zeros((x.shape[0], 1, x.shape[2]))
+        sums = np.concatenate([pad, np.cumsum(np.where(valid, x, 0), axis = 1)], axis = 1)
+        counts = np.concatenate([pad, np.cumsum(valid, axis = 1)], axis = 1)
+
+        hi = np.arange(1, len(years) + 1)
+        lo = np.maximum(hi - window, 0)
+        n = counts[:, hi] - counts[:, lo]
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            means = (sums[:, hi] - sums[:, lo]) / n
+        means[n < min_periods] = np.nan
+
+        return self._frame(means, years, metrics)
+
+    #change from the previous year, absolute or as a fraction of the previous value
+    def yoy(self, metrics = None, pct = False):
+
+        x, years, metrics = self._block(metrics)
+        delta = np.full_like(x, np.nan)
+        delta[:, 1:] = x[:, 1:] - x[:, :-1]
+
+        if pct:
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                delta[:, 1:] /= np.abs(x[:, :-1])
+            delta[~np.isfinite(delta)] = np.nan
+
+        return self._frame(delta, years, metrics)
+
+    #first and last reported year and value of every series inside the year range
+    def _endpoints(self, x, years):
+        valid = ~np.isnan(x)
+        has_data = valid.any(axis = 1)
+        first = valid.argmax(axis = 1)
+        last = x.shape[1] - 1 - valid[:, ::-1].argmax(axis = 1)
+        first_value = np.take_along_axis(x, first[:, None], axis = 1)[:, 0]
+        last_value = np.take_along_axis(x, last[:, None], axis = 1)[:, 0]
+        return has_data, years[first], years[last], first_value, last_value
+
+    #compound annual growth between the first and last reported years of the range, per state and metric
+    def cagr(self, start = None, end = None, metrics = None):
+
+        x, years, metrics = self._block(metrics, start, end)
+        has_data, first_year, last_year, first_value, last_value = self._endpoints(x, years)
+        span = (last_year - first_year).astype(np.float64)
+
+        ok = has_data & (span > 0) & (first_value > 0) & (last_value >= 0)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            growth = np.where(ok, (last_value / first_value) ** (1 / np.where(ok, span, 1)) - 1, np.nan)
+
+        return pd.DataFrame(growth, index = self.states, columns = metrics)
+
+    #least-squares fits of every series at once: kind 'linear' fits the values, 'log' fits their
+    #logarithm (an exponential trend); returns (state, metric) arrays of slope, intercept, r2 and n
+    def _fit_arrays(self, x, years, kind):
+
+        if kind == 'log':
+            with np.errstate(invalid = 'ignore', divide = 'ignore'):
+                x = np.where(x > 0, np.log(x), np.nan)
+        elif kind != 'linear':
+            raise ValueError(f"Unknown trend kind {kind!r}, expected 'linear' or 'log'")
+
+        valid = ~np.isnan(x)
+        #centring the years keeps the sums well conditioned
+        origin = years.mean() if len(years) else 0.0
+        t = (years - origin)[None, :, None] * valid
+        y = np.where(valid, x, 0)
+
+        n = valid.sum(axis = 1).astype(np.float64)
+        st, sy = t.sum(axis = 1), y.sum(axis = 1)
+        stt, sty, syy = (t * t).sum(axis = 1), (t * y).sum(axis = 1), (y * y).sum(axis = 1)
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            var_t = n * stt - st * st
+            var_y = n * syy - sy * sy
+            cov = n * sty - st * sy
+            slope = np.where((n >= 2) & (var_t > 0), cov / var_t, np.nan)
+            intercept = (sy - slope * st) / n - slope * origin
+            r2 = np.where(var_y > 0, cov * cov / (var_t * var_y), 1.0)
+
+        r2 = np.where(np.isnan(slope), np.nan, r2)
+        return {'slope': slope, 'intercept': intercept, 'r2': r2, 'n': n}
+
+    #fitted trend per (state, metric); for log fits annual_growth is the implied yearly growth rate
+    def fit(self, kind = 'linear', start = None, end = None, metrics = None):
+
+        x, years, metrics = self._block(metrics, start, end)
+        fits = self._fit_arrays(x, years, kind)
+
+        index = pd.MultiIndex.from_product([self.states, pd.Index(metrics, name = 'metric')])
+        fitted = pd.DataFrame({name: values.ravel() for name, values in fits.items()}, index = index)
+        if kind == 'log':
+            fitted['annual_growth'] = np.expm1(fitted['slope'])
+        return fitted
+
+    #trend values at the given years (past or future) from fits over the year range
+    def project(self, years, kind = 'linear', start = None, end = None, metrics = None):
+
+        x, fit_years, metrics = self._block(metrics, start, end)
+        fits = self._fit_arrays(x, fit_years, kind)
+
+        target = np.asarray(list(years), dtype = np.float64)
+        projected = fits['intercept'][:, None, :] + fits['slope'][:, None, :] * target[None, :, None]
+        if kind == 'log':
+            projected = np.exp(projected)
+
+        return self._frame(projected, target.astype(np.int64), metrics)
+
+    #the year metric first exceeds other in the data, and where it has not yet, the year the two
+    #fitted trends cross (within horizon); e.g. crossover('renewable_GWh_total', 'coal_GWh_total')
+    def crossover(self, metric, other, kind = 'linear', start = None, end = None, horizon = 2100):
+
+        x, years, _ = self._block([metric, other], start, end)
+        a, b = x[:, :, 0], x[:, :, 1]
+        both = ~np.isnan(a) & ~np.isnan(b)
+        ahead = both & (a > b)
+
+        has_data = both.any(axis = 1)
+        observed = np.where(ahead.any(axis = 1), years[ahead.argmax(axis = 1)], np.nan)
+
+        #standing at the latest year where both series were reported
+        latest = x.shape[1] - 1 - both[:, ::-1].argmax(axis = 1)
+        ahead_now = has_data & ahead[np.arange(len(latest)), latest]
+
+        fits = self._fit_arrays(x, years, kind)
+        gap = fits['intercept'][:, 0] - fits['intercept'][:, 1]
+        closing = fits['slope'][:, 0] - fits['slope'][:, 1]
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            crossing = -gap / closing
+        latest_year = years[latest].astype(np.float64)
+        projected = np.where(
+            has_data & ~ahead_now & (closing > 0) & (crossing <= horizon),
+            np.ceil(np.maximum(crossing, latest_year + 1)), np.nan
+        )
+
+        status = np.select(
+            [~has_data, ahead_now, closing > 0],
+            ['no data', 'ahead', 'converging'],
+            'diverging'
+        )
+        status = np.where(~ahead_now & (closing > 0) & np.isnan(projected) & has_data, 'beyond horizon', status)
+
+        return pd.DataFrame({
+            'observed_year': observed,
+            'projected_year': projected,
+            'status': status,
+        }, index = self.states)
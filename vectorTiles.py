@@ -0,0 +1,438 @@
+import gzip
+import http.server
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+from pipelineTrace import traced
+from stateGeometry import simplify_coverage
+
+#half the width of the web mercator world in meters
+MERCATOR_HALF_WORLD = 20037508.342789244
+
+#tile coordinate resolution and how far (in tile units) geometry is kept past the tile edge
+EXTENT = 4096
+BUFFER = 64
+
+#protobuf wire types used by the vector tile schema
+_VARINT, _LENGTH, _FIXED64 = 0, 2, 1
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == _LENGTH:
+        return key + _varint(len(payload)) + payload
+    return key + payload
+
+def _packed(numbers):
+    return b''.join(_varint(number) for number in numbers)
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def _read_varint(data, position):
+    result = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+#splitting one protobuf message into (field number, wire type, value) triples
+def _fields(data):
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == _VARINT:
+            value, position = _read_varint(data, position)
+        elif wire_type == _LENGTH:
+            length, position = _read_varint(data, position)
+            value = bytes(data[position:position + length])
+            position += length
+        elif wire_type == _FIXED64:
+            value = bytes(data[position:position + 8])
+            position += 8
+        else:
+            value = bytes(data[position:position + 4])
+            position += 4
+        yield number, wire_type, value
+
+def _unpacked(data):
+    values, position = [], 0
+    while position < len(data):
+        value, position = _read_varint(data, position)
+        values.append(value)
+    return values
+
+#a vector tile Value message: strings, integers and doubles
+def _value(value):
+    if isinstance(value, str):
+        return _field(1, _LENGTH, value.encode('utf-8'))
+    if isinstance(value, (bool, np.bool_)):
+        return _field(7, _VARINT, _varint(int(value)))
+    if isinstance(value, (int, np.integer)) and value >= 0:
+        return _field(5, _VARINT, _varint(int(value)))
+    return _field(3, _FIXED64, np.float64(value).tobytes())
+
+def _decode_value(data):
+    for number, _, value in _fields(data):
+        if number == 1:
+            return value.decode('utf-8')
+        if number == 3:
+            return float(np.frombuffer(value, dtype = '<f8')[0])
+        if number == 2:
+            return float(np.frombuffer(value[:4], dtype = '<f4')[0])
+        if number in (4, 5):
+            return value
+        if number == 6:
+            return (value >> 1) ^ -(value & 1)
+        if number == 7:
+            return bool(value)
+    return None
+
+#ring in tile pixels, closed or not, to MoveTo/LineTo/ClosePath commands with zigzag deltas
+def _ring_commands(ring, cursor):
+    commands = [(1 & 0x7) | (1 << 3)]
+    x0, y0 = cursor
+    for i, (x, y) in enumerate(ring):
+        if i == 1:
+            commands.append((2 & 0x7) | ((len(ring) - 1) << 3))
+        commands += [_zigzag(int(x - x0)), _zigzag(int(y - y0))]
+        x0, y0 = x, y
+    commands.append((7 & 0x7) | (1 << 3))
+    return commands, (x0, y0)
+
+#quantized ring without the closing point or repeated vertices, None when it collapsed
+def _quantize_ring(coords, minx, maxy, scale):
+    pixels = np.rint(np.column_stack([(coords[:, 0] - minx) * scale, (maxy - coords[:, 1]) * scale])).astype(np.int64)
+    keep = np.r_[True, np.any(pixels[1:] != pixels[:-1], axis = 1)]
+    pixels = pixels[keep]
+    if len(pixels) > 1 and (pixels[0] == pixels[-1]).all():
+        pixels = pixels[:-1]
+    if len(pixels) < 3:
+        return None, 0
+    x, y = pixels[:, 0], pixels[:, 1]
+    area = np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+    return (pixels, area) if area else (None, 0)
+
+#polygon geometry commands in tile pixels; exterior rings wind clockwise on screen, holes counter-clockwise
+def _polygon_commands(geometry, minx, maxy, scale):
+    commands, cursor = [], (0, 0)
+    for polygon in shapely.get_parts(geometry):
+        if shapely.get_type_id(polygon) != 3:
+            continue
+        exterior, area = _quantize_ring(shapely.get_coordinates(polygon.exterior), minx, maxy, scale)
+        if exterior is None:
+            continue
+        rings = [exterior if area > 0 else exterior[::-1]]
+        for interior in polygon.interiors:
+            hole, hole_area = _quantize_ring(shapely.get_coordinates(interior), minx, maxy, scale)
+            if hole is not None:
+                rings.append(hole if hole_area < 0 else hole[::-1])
+        for ring in rings:
+            ring_commands, cursor = _ring_commands(ring, cursor)
+            commands += ring_commands
+    return commands
+
+#a Layer message from (feature id, geometry commands, properties) triples
+def _layer(name, features):
+
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, commands, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        encoded.append(
+            _field(1, _VARINT, _varint(feature_id)) +
+            (_field(2, _LENGTH, _packed(tags)) if tags else b'') +
+            _field(3, _VARINT, _varint(3)) +
+            _field(4, _LENGTH, _packed(commands))
+        )
+
+    return (
+        _field(15, _VARINT, _varint(2)) +
+        _field(1, _LENGTH, name.encode('utf-8')) +
+        b''.join(_field(2, _LENGTH, feature) for feature in encoded) +
+        b''.join(_field(3, _LENGTH, key.encode('utf-8')) for key in keys) +
+        b''.join(_field(4, _LENGTH, _value(value)) for _, value in values) +
+        _field(5, _VARINT, _varint(EXTENT))
+    )
+
+def tile_bounds(z, x, y):
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** z
+    minx = -MERCATOR_HALF_WORLD + x * size
+    maxy = MERCATOR_HALF_WORLD - y * size
+    return minx, maxy - size, minx + size, maxy
+
+#every tile of one zoom level: geometries simplified once for the zoom, then clipped per tile
+def _render_zoom(z, geometries, properties, layer_name):
+
+    size = 2 * MERCATOR_HALF_WORLD / 2 ** z
+    scale = EXTENT / size
+    #the states are simplified as one coverage, so neighbours keep sharing the same simplified border
+    #instead of opening gaps or overlaps along it
+    simplified = simplify_coverage(geometries, size / EXTENT)
+    tree = shapely.STRtree(simplified)
+
+    n = 2 ** z
+    bounds = shapely.bounds(simplified)
+    tiles = set()
+    for minx, miny, maxx, maxy in bounds:
+        x0, x1 = [min(max(int((v + MERCATOR_HALF_WORLD) // size), 0), n - 1) for v in (minx, maxx)]
+        y0, y1 = [min(max(int((MERCATOR_HALF_WORLD - v) // size), 0), n - 1) for v in (maxy, miny)]
+        tiles.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+    margin = size * BUFFER / EXTENT
+    rendered = []
+    for x, y in sorted(tiles):
+        minx, miny, maxx, maxy = tile_bounds(z, x, y)
+        features = []
+        for i in sorted(tree.query(shapely.box(minx, miny, maxx, maxy))):
+            clipped = shapely.clip_by_rect(simplified[i], minx - margin, miny - margin, maxx + margin, maxy + margin)
+            if clipped.is_empty:
+                continue
+            commands = _polygon_commands(clipped, minx, maxy, scale)
+            if commands:
+                features.append((int(i) + 1, commands, properties[i]))
+        if features:
+            rendered.append((z, x, y, gzip.compress(_field(3, _LENGTH, _layer(layer_name, features)), mtime = 0)))
+
+    return rendered
+
+#{layer name: [{'id', 'properties', 'geometry'}]} from an encoded tile, gzipped or not; geometry is
+#left as the raw command integers
+def decode_tile(blob):
+
+    data = gzip.decompress(blob) if blob[:2] == b'\x1f\x8b' else blob
+    layers = {}
+    for number, _, layer_data in _fields(data):
+        if number != 3:
+            continue
+        name, keys, values, raw_features = None, [], [], []
+        for field, _, value in _fields(layer_data):
+            if field == 1:
+                name = value.decode('utf-8')
+            elif field == 2:
+                raw_features.append(value)
+            elif field == 3:
+                keys.append(value.decode('utf-8'))
+            elif field == 4:
+                values.append(_decode_value(value))
+
+        features = []
+        for raw in raw_features:
+            feature = {'id': None, 'properties': {}, 'geometry': []}
+            for field, _, value in _fields(raw):
+                if field == 1:
+                    feature['id'] = value
+                elif field == 2:
+                    tags = _unpacked(value)
+                    feature['properties'] = {keys[k]: values[v] for k, v in zip(tags[::2], tags[1::2])}
+                elif field == 4:
+                    feature['geometry'] = _unpacked(value)
+            features.append(feature)
+        layers[name] = features
+    return layers
+
+#re-encoding a shared geometry tile with one year's attributes joined on feature id; the geometry
+#commands are copied as they are, so no clipping or simplification is repeated per year
+def year_tile(blob, attributes):
+
+    layers = decode_tile(blob)
+    data = b''
+    for name, features in layers.items():
+        data += _field(3, _LENGTH, _layer(name, [
+            (feature['id'], feature['geometry'], {**feature['properties'], **attributes.get(str(feature['id']), {})})
+            for feature in features
+        ]))
+    return gzip.compress(data, mtime = 0)
+
+#one year's attributes as {feature id: {column: value}}, dropping missing values
+def _year_attributes(states_gdf, df, key, columns):
+    frame = df.reindex(states_gdf[key].to_numpy())
+    if columns is not None:
+        frame = frame[[column for column in columns if column in frame.columns]]
+    frame = frame.astype(np.float64).rename(columns = str)
+    attributes = {}
+    for feature_id, record in enumerate(frame.to_dict('records'), start = 1):
+        values = {column: value for column, value in record.items() if math.isfinite(value)}
+        if values:
+            attributes[str(feature_id)] = values
+    return attributes
+
+#adding (or replacing) a year's attributes in an existing tileset; the tiles are not touched
+def add_tile_year(mbtiles_path, year, states_gdf, df, key = 'STUSPS', columns = None):
+
+    attributes = _year_attributes(states_gdf, df, key, columns)
+    connection = sqlite3.connect(mbtiles_path)
+    try:
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO yearly_attributes (year, data) VALUES (?, ?)',
+                               (int(year), json.dumps(attributes)))
+            years = [row[0] for row in connection.execute('SELECT year FROM yearly_attributes ORDER BY year')]
+            connection.execute("INSERT OR REPLACE INTO metadata (name, value) VALUES ('years', ?)", (json.dumps(years),))
+    finally:
+        connection.close()
+    return mbtiles_path
+
+#MBTiles of the state polygons, tiled once for every zoom level, with each year's attributes stored
+#next to them keyed by feature id; clients join them per year (or the tile server bakes them in)
+@traced('vector_tiles', output = lambda result, arguments: arguments['mbtiles_path'])
+def write_vector_tiles(mbtiles_path, states_gdf, yearly_dfs, min_zoom = 0, max_zoom = 6, key = 'STUSPS',
+                       columns = None, layer_name = 'states', workers = None):
+
+    if os.path.exists(mbtiles_path):
+        os.remove(mbtiles_path)
+
+    mercator = states_gdf.to_crs('EPSG:3857')
+    geometries = np.asarray(mercator.geometry.values, dtype = object)
+    property_columns = [column for column in (key, 'NAME') if column in states_gdf.columns]
+    properties = [{column: str(value) for column, value in zip(property_columns, row)}
+                  for row in states_gdf[property_columns].itertuples(index = False, name = None)]
+
+    zooms = list(range(min_zoom, max_zoom + 1))
+    if workers is None or workers <= 1:
+        rendered = [_render_zoom(z, geometries, properties, layer_name) for z in zooms]
+    else:
+        #deepest zooms first so the largest levels start early
+        with ProcessPoolExecutor(max_workers = workers) as ex:
+            rendered = list(ex.map(_render_zoom, zooms[::-1], [geometries] * len(zooms),
+                                   [properties] * len(zooms), [layer_name] * len(zooms)))
+
+    west, south, east, north = states_gdf.to_crs('EPSG:4326').total_bounds
+    fields = {column: 'String' for column in property_columns}
+    metadata = {
+        'name': layer_name,
+        'format': 'pbf',
+        'type': 'overlay',
+        'version': '1',
+        'minzoom': str(min_zoom),
+        'maxzoom': str(max_zoom),
+        'bounds': f'{west},{south},{east},{north}',
+        'center': f'{(west + east) / 2},{(south + north) / 2},{min_zoom}',
+        'json': json.dumps({'vector_layers': [
+            {'id': layer_name, 'fields': fields, 'minzoom': min_zoom, 'maxzoom': max_zoom}
+        ]}),
+        'years': '[]',
+    }
+
+    connection = sqlite3.connect(mbtiles_path)
+    try:
+        with connection:
+            connection.execute('CREATE TABLE metadata (name TEXT PRIMARY KEY, value TEXT)')
+            connection.execute('CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, '
+                               'tile_data BLOB, PRIMARY KEY (zoom_level, tile_column, tile_row))')
+            connection.execute('CREATE TABLE yearly_attributes (year INTEGER PRIMARY KEY, data TEXT)')
+            connection.executemany('INSERT INTO metadata (name, value) VALUES (?, ?)', metadata.items())
+            #MBTiles rows count from the south (TMS)
+            connection.executemany(
+                'INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                ((z, x, 2 ** z - 1 - y, blob) for level in rendered for z, x, y, blob in level)
+            )
+    finally:
+        connection.close()
+
+    for year in sorted(yearly_dfs, key = int):
+        add_tile_year(mbtiles_path, year, states_gdf, yearly_dfs[year], key = key, columns = columns)
+
+    return mbtiles_path
+
+#a local stand-in tile server over an MBTiles file:
+#  /metadata.json                TileJSON
+#  /{z}/{x}/{y}.pbf              shared geometry tile
+#  /{year}/{z}/{x}/{y}.pbf       the same tile with that year's attributes
+#  /attributes/{year}.json       a year's attributes keyed by feature id
+class _TileHandler(http.server.BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, body, content_type, encoding = None, status = 200):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?')[0]
+
+        with server.lock:
+            if path == '/metadata.json':
+                metadata = dict(server.connection.execute('SELECT name, value FROM metadata'))
+                host = f'http://{self.headers.get("Host")}'
+                body = {**{k: v for k, v in metadata.items() if k != 'json'}, **json.loads(metadata.get('json', '{}')),
+                        'tilejson': '3.0.0', 'tiles': [host + '/{z}/{x}/{y}.pbf']}
+                self._send(json.dumps(body).encode(), 'application/json')
+                return
+
+            match = re.fullmatch(r'/attributes/(\d+)\.json', path)
+            if match:
+                row = server.connection.execute('SELECT data FROM yearly_attributes WHERE year = ?',
+                                                (int(match.group(1)),)).fetchone()
+                if row is None:
+                    self._send(b'{}', 'application/json', status = 404)
+                else:
+                    self._send(row[0].encode(), 'application/json')
+                return
+
+            match = re.fullmatch(r'(?:/(\d+))?/(\d+)/(\d+)/(\d+)\.pbf', path)
+            if match is None:
+                self._send(b'not found', 'text/plain', status = 404)
+                return
+
+            year = match.group(1)
+            z, x, y = (int(group) for group in match.groups()[1:])
+            row = server.connection.execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                (z, x, 2 ** z - 1 - y)
+            ).fetchone()
+            attributes = None
+            if row is not None and year is not None:
+                attributes = server.connection.execute('SELECT data FROM yearly_attributes WHERE year = ?',
+                                                       (int(year),)).fetchone()
+
+        if row is None:
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        blob = row[0] if attributes is None else year_tile(row[0], json.loads(attributes[0]))
+        self._send(blob, 'application/vnd.mapbox-vector-tile', encoding = 'gzip')
+
+def serve_tiles(mbtiles_path, host = '127.0.0.1', port = 0):
+    server = http.server.ThreadingHTTPServer((host, port), _TileHandler)
+    server.connection = sqlite3.connect(mbtiles_path, check_same_thread = False)
+    server.lock = threading.Lock()
+    server.serve_thread = threading.Thread(target = server.serve_forever, daemon = True)
+    server.serve_thread.start()
+    return server